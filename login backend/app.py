@@ -1,20 +1,41 @@
 # A simple backend server using Python Flask
 # You will need to install the following packages:
-# pip install Flask Flask-SQLAlchemy Flask-Mail Flask-Cors python-dotenv werkzeug
+# pip install Flask Flask-SQLAlchemy Flask-Cors python-dotenv werkzeug
 # Make sure you also have `os`, `time`, and `random` which are standard Python libraries.
 
 # 1. Import necessary packages
+import io
 import os
+import re
+import json
 import time
 import random
+import base64
+import mimetypes
+import click
 from datetime import datetime, timezone
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory, g, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
-from flask_mail import Mail, Message
+from sqlalchemy import func, or_, and_, select, insert, update, delete, case, literal
+from sqlalchemy.exc import IntegrityError
 from flask_cors import CORS
-from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.security import safe_join
+from response_cache import ResponseCache, make_cache_backend
+from otp_store import make_otp_store, start_sweeper, mail_job_status, metadata as otp_store_metadata
+from mail_queue import MailDispatcher
+from password_hasher import PasswordHasher, PasswordHasherBusy
+from upload_storage import UploadStorage, make_request_class
+from thumbnails import ThumbnailGenerator, THUMBNAIL_SIZES
+import search_index
+import lawyer_transfer
+from rights_index import RightsIndex, load_knowledge_base
+import database
+from event_bus import make_event_bus
+from metrics import RequestMetrics
+from rate_limiter import RateLimiter, make_rate_limit_backend
+from auth_tokens import TokenService, InvalidToken, UserCache, CachedUser
 
 # Load environment variables from .env file
 load_dotenv()
@@ -27,23 +48,155 @@ app.secret_key = os.getenv("SECRET_KEY", "a-fallback-secret-key-for-development"
 CORS(app, origins=[os.getenv("FRONTEND_URL", "*")], supports_credentials=True)
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv("DATABASE_URL", "sqlite:///users.db")
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = database.engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 db = SQLAlchemy(app)
+with app.app_context():
+    database.configure_sqlite(db.engine) # WAL, synchronous=NORMAL, busy timeout, cache/mmap sizes
+
+# --- Metrics Configuration ---
+# Requests running more than METRICS_MAX_QUERIES statements, and statements slower than
+# METRICS_SLOW_QUERY_SECONDS, are logged with a stack trace. PROFILE_REQUESTS=true lets
+# ?__profile=1 write a sampled flame-graph profile of that request to PROFILE_DIR.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN') # If set, /metrics requires "Authorization: Bearer <token>"
+with app.app_context():
+    request_metrics = RequestMetrics(
+        app, db.engine,
+        max_queries=int(os.getenv('METRICS_MAX_QUERIES', 20)),
+        slow_query_seconds=float(os.getenv('METRICS_SLOW_QUERY_SECONDS', 0.25)),
+        profiling=os.getenv('PROFILE_REQUESTS', 'False').lower() in ('true', '1', 't'),
+        profile_dir=os.getenv('PROFILE_DIR', 'profiles')
+    )
 app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER', 'smtp.gmail.com')
 app.config['MAIL_PORT'] = int(os.getenv('MAIL_PORT', 587))
 app.config['MAIL_USE_TLS'] = os.getenv('MAIL_USE_TLS', 'True').lower() in ('true', '1', 't')
 app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME')
 app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD')
-mail = Mail(app)
+# Emails are sent by background workers that keep their SMTP connection open.
+mail_dispatcher = MailDispatcher(
+    server=app.config['MAIL_SERVER'],
+    port=app.config['MAIL_PORT'],
+    username=app.config['MAIL_USERNAME'],
+    password=app.config['MAIL_PASSWORD'],
+    use_tls=app.config['MAIL_USE_TLS'],
+    workers=int(os.getenv('MAIL_WORKERS', 2)),
+    max_retries=int(os.getenv('MAIL_MAX_RETRIES', 3))
+)
+
+# --- Password Hashing Configuration ---
+# Hashes run on a small thread pool; when more than PASSWORD_HASH_MAX_PENDING are waiting,
+# /register and /login answer 503 straight away instead of queueing more work.
+password_hasher = PasswordHasher(
+    method=os.getenv('PASSWORD_HASH_METHOD', 'scrypt'),
+    salt_length=int(os.getenv('PASSWORD_HASH_SALT_LENGTH', 16)),
+    workers=int(os.getenv('PASSWORD_HASH_WORKERS', 2)),
+    max_pending=int(os.getenv('PASSWORD_HASH_MAX_PENDING', 32)),
+    observer=request_metrics.observe_password_hash
+)
 
-# --- In-memory OTP Store (For production, use Redis) ---
-otp_store = {}
+# --- Session Token Configuration ---
+# /login returns a signed access token (sent as "Authorization: Bearer ...") and a refresh token.
+# Until every client sends tokens, requests without one may still identify the user with a
+# user_id field; set AUTH_REQUIRE_TOKENS=true to stop accepting that.
+token_service = TokenService(
+    app.secret_key,
+    access_ttl=int(os.getenv('ACCESS_TOKEN_TTL_SECONDS', 15 * 60)),
+    refresh_ttl=int(os.getenv('REFRESH_TOKEN_TTL_SECONDS', 30 * 24 * 3600))
+)
+AUTH_REQUIRE_TOKENS = os.getenv('AUTH_REQUIRE_TOKENS', 'False').lower() in ('true', '1', 't')
+# Routes that ignore the Bearer token: /metrics and /lawyers/import|export use their own scheme, and the
+# sign-in routes must keep working while the client still holds an expired access token.
+AUTH_EXEMPT_ENDPOINTS = {'metrics', 'import_lawyers', 'export_lawyers', 'login', 'register', 'verify_email', 'refresh_token'}
+
+# --- Rate Limit Configuration (set RATE_LIMIT_REDIS_URL to share limits between workers) ---
+# Rates are "<count>/<period>", e.g. '10/hour' or '5/15minutes'; an empty value turns that check off.
+rate_limiter = RateLimiter(
+    make_rate_limit_backend(redis_url=os.getenv('RATE_LIMIT_REDIS_URL'),
+                            max_entries=int(os.getenv('RATE_LIMIT_MAX_ENTRIES', 100000))),
+    enabled=os.getenv('RATE_LIMIT_ENABLED', 'True').lower() in ('true', '1', 't')
+)
+RATE_LIMITS = {
+    'register': {'ip': os.getenv('RATE_LIMIT_REGISTER_IP', '10/hour'),
+                 'email': os.getenv('RATE_LIMIT_REGISTER_EMAIL', '3/15minutes')},
+    'verify_email': {'ip': os.getenv('RATE_LIMIT_VERIFY_IP', '30/hour'),
+                     'email': os.getenv('RATE_LIMIT_VERIFY_EMAIL', '5/15minutes')},
+    'login': {'ip': os.getenv('RATE_LIMIT_LOGIN_IP', '30/minute'),
+              'email': os.getenv('RATE_LIMIT_LOGIN_EMAIL', '10/15minutes')},
+    # Per IP only: reading the email would mean parsing (and storing) the uploaded files first.
+    'register_lawyer': {'ip': os.getenv('RATE_LIMIT_LAWYER_REGISTER_IP', '5/hour')},
+    'import_lawyers': {'ip': os.getenv('RATE_LIMIT_LAWYER_IMPORT_IP', '10/hour')},
+}
+RATE_LIMITS = {route: {kind: rate or None for kind, rate in rates.items()} for route, rates in RATE_LIMITS.items()}
+
+# --- OTP Store Configuration ---
+# 'memory' only works with a single worker; use 'database' or 'redis' when running several.
+OTP_STORE_BACKEND = os.getenv('OTP_STORE_BACKEND', 'memory')
+OTP_STORE_MAX_ENTRIES = int(os.getenv('OTP_STORE_MAX_ENTRIES', 10000))
 OTP_EXPIRATION_SECONDS = 300 # 5 minutes
+MAIL_JOB_STATUS_TTL_SECONDS = 3600 # How long /register/mail-status can report on a job
 
 # --- File Upload Configuration ---
 UPLOAD_FOLDER = 'uploads'
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# Whole request body limit (checked before reading) and per-file limit (checked while streaming)
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('UPLOAD_MAX_REQUEST_BYTES', 45 * 1024 * 1024))
+upload_storage = UploadStorage(UPLOAD_FOLDER, max_file_size=int(os.getenv('UPLOAD_MAX_FILE_BYTES', 10 * 1024 * 1024)))
+app.request_class = make_request_class(upload_storage)
+thumbnail_generator = ThumbnailGenerator(UPLOAD_FOLDER)
+# How /uploads hands files out: '' streams them from Flask, 'x-sendfile' (Apache/lighttpd) or
+# 'x-accel' (nginx, with an internal location at UPLOAD_ACCEL_PREFIX) let the web server do it.
+UPLOAD_SENDFILE_MODE = os.getenv('UPLOAD_SENDFILE_MODE', '')
+UPLOAD_ACCEL_PREFIX = os.getenv('UPLOAD_ACCEL_PREFIX', '/protected-uploads/')
+app.config['USE_X_SENDFILE'] = UPLOAD_SENDFILE_MODE == 'x-sendfile'
+# Content-addressed files never change; legacy flat-named ones might be replaced.
+UPLOAD_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+UPLOAD_LEGACY_MAX_AGE = int(os.getenv('UPLOAD_LEGACY_MAX_AGE', 3600))
+UPLOAD_FALLBACK_MAX_AGE = 60 # Original served for ?size= while the rendition is being made
+CONTENT_ADDRESSED_NAME = re.compile(r'^[0-9a-f]{64}$')
+
+# --- Read Cache Configuration (set CACHE_REDIS_URL to share entries between workers) ---
+response_cache = ResponseCache(make_cache_backend(
+    redis_url=os.getenv('CACHE_REDIS_URL'),
+    max_entries=int(os.getenv('CACHE_MAX_ENTRIES', 1024)),
+    ttl=int(os.getenv('CACHE_TTL_SECONDS', 60))
+))
+
+# --- Live Updates (/stream) Configuration (set EVENT_BUS_REDIS_URL to share events between workers) ---
+event_bus = make_event_bus(redis_url=os.getenv('EVENT_BUS_REDIS_URL'), max_queued=int(os.getenv('STREAM_MAX_QUEUED', 100)))
+STREAM_KEEPALIVE_SECONDS = 15
+
+# --- Rights Q&A (/ask) Configuration ---
+# Answers come from knowledge/rights.json and from forum comments written by approved lawyers.
+# The index lives in RIGHTS_INDEX_DIR and is rebuilt at startup when the knowledge base changes.
+# Answers added or dropped later are applied to the index of the worker that made the change and
+# logged in rights_index_change; /ask on every other worker replays that log before searching.
+RIGHTS_KNOWLEDGE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'knowledge', 'rights.json')
+rights_index = RightsIndex(
+    os.getenv('RIGHTS_INDEX_DIR', 'rights_index'),
+    use_embeddings=os.getenv('RIGHTS_INDEX_EMBEDDINGS', 'True').lower() in ('true', '1', 't'),
+    cache_size=int(os.getenv('ASK_CACHE_MAX_ENTRIES', 512))
+)
+ASK_MAX_RESULTS = 20
+RIGHTS_INDEX_CHANGE_RETENTION_SECONDS = 7 * 24 * 3600 # Workers idle for longer re-sync from the database
+ASK_DISCLAIMER = 'General legal information, not legal advice. Talk to a lawyer about your situation.'
+
+# --- Comment Deletion Mode ---
+# 'cascade' removes a comment together with all of its replies.
+# 'tombstone' keeps comments that have replies as a '[deleted]' placeholder so the rest of the
+# thread stays in place; comments without replies are still removed.
+COMMENT_DELETE_MODE = os.getenv('COMMENT_DELETE_MODE', 'cascade')
+
+# --- Feed Pagination Configuration ---
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+# Most items accepted by one batch write request
+MAX_BATCH_SIZE = 500
+# Rows per INSERT batch / SELECT batch in the lawyer import and export
+LAWYER_TRANSFER_BATCH_SIZE = int(os.getenv('LAWYER_TRANSFER_BATCH_SIZE', 1000))
+# Bulk onboarding belongs to the CLI (flask --app app import-lawyers / export-lawyers). The HTTP
+# endpoints stay off unless LAWYER_TRANSFER_TOKEN is set, and then need "Authorization: Bearer <token>".
+LAWYER_TRANSFER_TOKEN = os.getenv('LAWYER_TRANSFER_TOKEN')
 
 # --- Database Models ---
 
@@ -51,7 +204,9 @@ app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 # This is a helper table for the many-to-many relationship between Users and Comments (for likes)
 comment_likes = db.Table('comment_likes',
     db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
-    db.Column('comment_id', db.Integer, db.ForeignKey('comment.id'), primary_key=True)
+    db.Column('comment_id', db.Integer, db.ForeignKey('comment.id'), primary_key=True),
+    # The primary key starts with user_id, so lookups by comment need their own index
+    db.Index('ix_comment_likes_comment_id', 'comment_id')
 )
 
 
@@ -83,10 +238,30 @@ class Lawyer(db.Model):
     bar_id_card_path = db.Column(db.String(255), nullable=False)
     enrollment_certificate_path = db.Column(db.String(255), nullable=True)
     govt_id_path = db.Column(db.String(255), nullable=True)
+    # SHA-256 of each uploaded document (files are stored under their digest)
+    profile_picture_digest = db.Column(db.String(64), nullable=True)
+    bar_id_card_digest = db.Column(db.String(64), nullable=True)
+    enrollment_certificate_digest = db.Column(db.String(64), nullable=True)
+    govt_id_digest = db.Column(db.String(64), nullable=True)
     # Status for admin approval: 'pending', 'approved', 'rejected'
     status = db.Column(db.String(20), default='pending', nullable=False)
     registration_date = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
 
+    # Indexes backing the /lawyers filters and its (registration_date, id) keyset pagination
+    __table_args__ = (
+        db.Index('ix_lawyer_status_registration', 'status', 'registration_date', 'id'),
+        db.Index('ix_lawyer_status_location', 'status', 'state_of_practice', 'city_of_practice'),
+        db.Index('ix_lawyer_enrollment_year', 'enrollment_year'),
+        db.Index('ix_lawyer_email_lower', db.text('lower(email)')), # Case-insensitive duplicate checks on import
+    )
+
+# Fields that /lawyers can return, in response order
+LAWYER_FIELDS = [
+    'id', 'full_name', 'email', 'contact_number', 'bar_enrollment_number', 'state_bar_council',
+    'enrollment_year', 'city_of_practice', 'state_of_practice', 'bio', 'profile_picture_path',
+    'bar_id_card_path', 'enrollment_certificate_path', 'govt_id_path', 'status', 'registration_date'
+]
+
 
 class Post(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -95,8 +270,15 @@ class Post(db.Model):
     location = db.Column(db.String(150), nullable=True)
     is_anonymous = db.Column(db.Boolean, default=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # Denormalized counter, kept in step by create_comment/delete_comment
+    comment_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
     comments = db.relationship('Comment', backref='post', lazy=True, cascade="all, delete-orphan")
 
+    __table_args__ = (
+        db.Index('ix_post_timestamp_id', 'timestamp', 'id'), # Feed order and keyset cursor
+        db.Index('ix_post_user_id', 'user_id'),
+    )
+
 
 # --- MODIFIED: Comment Model ---
 class Comment(db.Model):
@@ -110,57 +292,351 @@ class Comment(db.Model):
     replies = db.relationship('Comment', backref=db.backref('parent', remote_side=[id]), lazy=True, cascade="all, delete-orphan")
     # --- NEW: For likes ---
     likes = db.relationship('User', secondary=comment_likes, back_populates='liked_comments')
+    # Denormalized counter, kept in step by toggle_like_comment
+    like_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    # Set instead of deleting when COMMENT_DELETE_MODE is 'tombstone' and the comment has replies
+    is_deleted = db.Column(db.Boolean, default=False, server_default=db.false(), nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_comment_post_id_timestamp', 'post_id', 'timestamp', 'id'), # Thread loading
+        db.Index('ix_comment_parent_id', 'parent_id'),
+    )
+
+# Forum answers whose place in the /ask index changed, for other workers to replay
+class RightsIndexChange(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    comment_id = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.Float, nullable=False, index=True) # time.time()
+
+
+def reconcile_counters():
+    """Recomputes Post.comment_count and Comment.like_count from the source tables."""
+    db.session.execute(update(Post).values(
+        comment_count=select(func.count(Comment.id))
+            .where(Comment.post_id == Post.id, Comment.is_deleted.is_(False)).scalar_subquery()
+    ))
+    db.session.execute(update(Comment).values(
+        like_count=select(func.count()).select_from(comment_likes)
+            .where(comment_likes.c.comment_id == Comment.id).scalar_subquery()
+    ))
+    db.session.commit()
+
+# --- Rights Index Maintenance ---
+def approved_answers_query(*entities):
+    """Forum comments written by approved lawyers (matched to their user account by email)."""
+    return db.session.query(*entities) \
+        .join(Post, Comment.post_id == Post.id) \
+        .join(User, Comment.user_id == User.id) \
+        .join(Lawyer, Lawyer.email == User.email) \
+        .filter(Lawyer.status == 'approved', Comment.is_deleted.is_(False))
+
+def answer_document(comment, question, lawyer_name):
+    return {
+        'key': f'comment:{comment.id}',
+        'source': 'forum',
+        'title': question[:120],
+        'text': comment.content,
+        'author': lawyer_name,
+        'post_id': comment.post_id,
+        'comment_id': comment.id,
+    }
+
+def rebuild_rights_index():
+    documents, fingerprint = load_knowledge_base(RIGHTS_KNOWLEDGE_FILE)
+    rows = approved_answers_query(Comment, Post.content, Lawyer.full_name).order_by(Comment.id)
+    documents.extend(answer_document(*row) for row in rows)
+    rights_index.build(documents, fingerprint)
+
+def sync_rights_index():
+    """Loads the index from disk, or rebuilds it if it is missing or the knowledge base changed,
+    then adds/drops forum answers that changed since it was built."""
+    _, fingerprint = load_knowledge_base(RIGHTS_KNOWLEDGE_FILE)
+    if not rights_index.load() or rights_index.fingerprint != fingerprint:
+        rebuild_rights_index()
+        return
+    indexed = {int(key.split(':', 1)[1]) for key in rights_index.keys('comment:')}
+    current = {comment_id for (comment_id,) in approved_answers_query(Comment.id)}
+    for comment_id in indexed - current:
+        rights_index.remove(f'comment:{comment_id}')
+    missing = current - indexed
+    if missing:
+        rows = approved_answers_query(Comment, Post.content, Lawyer.full_name).filter(Comment.id.in_(missing))
+        for row in rows:
+            rights_index.add(answer_document(*row))
+
+def refresh_answers(comment_ids):
+    """Re-reads these forum answers into this worker's index, dropping any that no longer qualify."""
+    for comment_id in comment_ids:
+        rights_index.remove(f'comment:{comment_id}')
+    for row in approved_answers_query(Comment, Post.content, Lawyer.full_name).filter(Comment.id.in_(comment_ids)):
+        rights_index.add(answer_document(*row))
 
+def record_rights_index_changes(comment_ids):
+    """Logs answers whose indexing changed so /ask on the other workers picks them up."""
+    if not comment_ids:
+        return
+    now = time.time()
+    db.session.execute(insert(RightsIndexChange), [{'comment_id': cid, 'created_at': now} for cid in comment_ids])
+    db.session.execute(delete(RightsIndexChange).where(
+        RightsIndexChange.created_at < now - RIGHTS_INDEX_CHANGE_RETENTION_SECONDS
+    ))
+    db.session.commit()
 
-# Create DB tables if they don't exist
+# Position of this worker in the rights_index_change log
+rights_index_changes_seen = {'id': 0, 'checked_at': 0.0}
+
+def apply_rights_index_changes():
+    """Replays answer changes logged by other workers since this one last looked (one query)."""
+    now = time.time()
+    seen = rights_index_changes_seen
+    if now - seen['checked_at'] > RIGHTS_INDEX_CHANGE_RETENTION_SECONDS / 2:
+        # Entries this old may have been pruned from the log; compare with the database instead.
+        last_id = db.session.query(func.max(RightsIndexChange.id)).scalar() or 0
+        sync_rights_index()
+        seen.update(id=last_id, checked_at=now)
+        return
+    rows = db.session.query(RightsIndexChange.id, RightsIndexChange.comment_id) \
+        .filter(RightsIndexChange.id > seen['id']).order_by(RightsIndexChange.id).all()
+    seen['checked_at'] = now
+    if rows:
+        seen['id'] = rows[-1].id
+        refresh_answers({row.comment_id for row in rows})
+
+def reindex_lawyer_answers(lawyer_ids):
+    """Adds or drops the forum answers of lawyers whose approval status changed."""
+    emails = [email for (email,) in db.session.query(Lawyer.email).filter(Lawyer.id.in_(lawyer_ids))]
+    if not emails:
+        return
+    comment_ids = [comment_id for (comment_id,) in db.session.query(Comment.id)
+                   .join(User, Comment.user_id == User.id).filter(User.email.in_(emails))]
+    refresh_answers(comment_ids)
+    record_rights_index_changes(comment_ids)
+
+@app.cli.command('build-rights-index')
+def build_rights_index_command():
+    """Usage: flask --app app build-rights-index"""
+    rebuild_rights_index()
+    print('✅ Rights index rebuilt.')
+
+def setup_database():
+    """Creates missing tables, applies pending migrations and sets up full-text search, all under
+    the migration lock so workers that start together don't race each other."""
+    with database.migration_lock(db.engine) as conn:
+        database.migrate(conn, db.metadata)
+        otp_store_metadata.create_all(conn)
+        search_index.setup(conn)
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Usage: flask --app app migrate (run once before starting the workers)"""
+    setup_database()
+    print(f'✅ Database schema is at version {database.LATEST_VERSION}.')
+
+# Create DB tables if they don't exist and apply pending schema migrations. After
+# `flask --app app migrate` this only confirms the schema is current.
 with app.app_context():
-    db.create_all()
+    setup_database()
+    apply_rights_index_changes() # Full sync with the database, then follows the change log
+    otp_store = make_otp_store(
+        OTP_STORE_BACKEND,
+        ttl=OTP_EXPIRATION_SECONDS,
+        max_entries=OTP_STORE_MAX_ENTRIES,
+        engine=db.engine,
+        redis_url=os.getenv('OTP_REDIS_URL')
+    )
+    # Mail job states go to the same backend, so a status poll can land on any worker.
+    mail_dispatcher.job_store = make_otp_store(
+        OTP_STORE_BACKEND,
+        ttl=MAIL_JOB_STATUS_TTL_SECONDS,
+        max_entries=OTP_STORE_MAX_ENTRIES,
+        engine=db.engine,
+        redis_url=os.getenv('OTP_REDIS_URL'),
+        table=mail_job_status,
+        redis_prefix='kyr:mail-job:'
+    )
+start_sweeper(otp_store, interval=60)
+start_sweeper(mail_dispatcher.job_store, interval=60)
+start_sweeper(rate_limiter.backend, interval=60)
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Usage: flask --app app rebuild-search-index"""
+    search_index.rebuild(db.engine)
+    print('✅ Search index rebuilt.')
+
+@app.cli.command('reconcile-counters')
+def reconcile_counters_command():
+    """Usage: flask --app app reconcile-counters"""
+    reconcile_counters()
+    print('✅ Post and comment counters reconciled.')
+
+@app.cli.command('import-lawyers')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(list(lawyer_transfer.FORMATS)), help='Defaults to the file extension')
+@click.option('--keep-status', is_flag=True, help="Keep the file's status column instead of importing everyone as pending")
+def import_lawyers_command(path, fmt, keep_status):
+    """Usage: flask --app app import-lawyers lawyers.csv"""
+    fmt = fmt or os.path.splitext(path)[1].lstrip('.').lower()
+    if fmt not in lawyer_transfer.FORMATS:
+        raise click.UsageError('Cannot tell the format from the file name; pass --format csv or --format jsonl.')
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        report = lawyer_transfer.import_lawyers(db.session, Lawyer, lawyer_transfer.read_rows(f, fmt),
+                                                batch_size=LAWYER_TRANSFER_BATCH_SIZE, keep_status=keep_status)
+    for error in report.to_dict()['errors']:
+        print(f"❌ Line {error['line']}: {error['error']}")
+    print(f'✅ Imported {report.inserted} lawyers ({report.duplicates} duplicates, {report.failed} failed).')
+
+@app.cli.command('export-lawyers')
+@click.argument('path', default='-')
+@click.option('--format', 'fmt', type=click.Choice(list(lawyer_transfer.FORMATS)), default='csv')
+@click.option('--status', type=click.Choice(sorted(lawyer_transfer.STATUSES)))
+def export_lawyers_command(path, fmt, status):
+    """Usage: flask --app app export-lawyers lawyers.csv (or - for stdout)"""
+    with click.open_file(path, 'w', encoding='utf-8') as f:
+        for chunk in lawyer_transfer.export_lawyers(db.session, Lawyer, LAWYER_FIELDS, fmt, status,
+                                                    batch_size=LAWYER_TRANSFER_BATCH_SIZE):
+            f.write(chunk)
 
 # --- Helper Functions ---
 def send_otp_email(email, otp):
-    """Sends an email with the OTP code."""
+    """Queues an email with the OTP code and returns the mail job id."""
+    def discard_otp():
+        # Delivery failed for good: drop the OTP unless the user has registered again since.
+        otp_data = otp_store.get(email)
+        if otp_data and otp_data['otp'] == otp:
+            otp_store.pop(email)
+    return mail_dispatcher.submit(
+        email,
+        'Your Verification Code',
+        f"Your one-time code is {otp}. It is valid for 5 minutes.",
+        on_failure=discard_otp
+    )
+
+def encode_cursor(timestamp, row_id):
+    """Builds an opaque keyset cursor from a (timestamp, id) pair."""
+    raw = f"{timestamp.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor):
+    """Parses a cursor made by encode_cursor. Raises ValueError if it is malformed."""
     try:
-        msg = Message('Your Verification Code', sender=app.config['MAIL_USERNAME'], recipients=[email])
-        msg.body = f"Your one-time code is {otp}. It is valid for 5 minutes."
-        mail.send(msg)
-        return True
-    except Exception as e:
-        print(f"❌ Failed to send email to {email}: {e}")
-        return False
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        timestamp, row_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except Exception:
+        raise ValueError('Invalid cursor.')
+
+def parse_page_size(value):
+    """Clamps a ?limit= value to [1, MAX_PAGE_SIZE]. Returns None if no limit was given."""
+    if value is None:
+        return None
+    return max(1, min(int(value), MAX_PAGE_SIZE))
+
+def auth_busy_response():
+    """503 returned when the password hashing pool is saturated."""
+    response = jsonify({'success': False, 'message': 'Server is busy, please try again shortly.'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+def format_post(post, author_name):
+    return {
+        'id': post.id,
+        'content': post.content,
+        'timestamp': post.timestamp.isoformat(),
+        'location': post.location,
+        'is_anonymous': post.is_anonymous,
+        'author': "Anonymous" if post.is_anonymous else author_name,
+        'user_id': post.user_id,
+        'comment_count': post.comment_count
+    }
+
+def publish_comment_count(post_id):
+    """Tells feed listeners the new comment count of a post."""
+    comment_count = db.session.query(Post.comment_count).filter_by(id=post_id).scalar()
+    event_bus.publish('posts', 'comment_count', {'post_id': post_id, 'comment_count': comment_count})
+
+def load_user_record(user_id):
+    row = db.session.query(User.id, User.name, User.email).filter_by(id=user_id, verified=True).first()
+    return CachedUser(row.id, row.name, row.email) if row else None
+
+user_cache = UserCache(
+    load_user_record,
+    max_entries=int(os.getenv('USER_CACHE_MAX_ENTRIES', 10000)),
+    ttl=int(os.getenv('USER_CACHE_TTL_SECONDS', 300))
+)
+
+def acting_user(data=None):
+    """The user making this request: the access token's user, or (for clients that do not send
+    tokens yet, unless AUTH_REQUIRE_TOKENS is set) the user_id field of the body or query string."""
+    if g.current_user or AUTH_REQUIRE_TOKENS:
+        return g.current_user
+    user_id = (data or {}).get('user_id') or request.args.get('user_id', type=int)
+    try:
+        return user_cache.get(int(user_id)) if user_id else None
+    except (TypeError, ValueError):
+        return None
+
+def auth_required_response():
+    return jsonify({'success': False, 'message': 'Authentication required.'}), 401
+
+@app.before_request
+def resolve_identity():
+    """Sets g.current_user from the Bearer access token, if the request has one."""
+    g.current_user = None
+    header = request.headers.get('Authorization', '')
+    if not header.startswith('Bearer ') or request.endpoint in AUTH_EXEMPT_ENDPOINTS:
+        return None
+    try:
+        user_id = token_service.load_access(header[len('Bearer '):])
+    except InvalidToken as e:
+        return jsonify({'success': False, 'message': str(e), 'token_expired': e.expired}), 401
+    g.current_user = user_cache.get(user_id)
+    if g.current_user is None:
+        return jsonify({'success': False, 'message': 'User not found.'}), 401
+    return None
 
 def is_otp_valid(email, otp_input):
     """Checks if the provided OTP is valid and not expired."""
-    otp_data = otp_store.get(email)
-    if not otp_data or time.time() - otp_data['timestamp'] > OTP_EXPIRATION_SECONDS:
-        otp_store.pop(email, None)
-        return False
-    return otp_data['otp'] == otp_input
+    otp_data = otp_store.get(email) # The store never returns expired entries
+    return bool(otp_data) and otp_data['otp'] == otp_input
 
 # --- Authentication Routes (Unchanged) ---
 @app.route('/register', methods=['POST'])
+@rate_limiter.limit('register', **RATE_LIMITS['register'])
 def register():
     try:
         data = request.get_json()
         name, email, password = data['name'], data['email'], data['password']
         if User.query.filter_by(email=email).first():
             return jsonify({'success': False, 'message': 'Email already registered.'}), 409
-        hashed_password = generate_password_hash(password)
+        hashed_password = password_hasher.hash(password)
         otp = str(random.randint(100000, 999999))
-        otp_store[email] = {
+        otp_store.put(email, {
             'name': name,
             'password': hashed_password,
-            'otp': otp,
-            'timestamp': time.time()
-        }
-        if send_otp_email(email, otp):
-            return jsonify({'success': True, 'message': 'Registration successful. Please check your email for the OTP.'})
-        else:
-            otp_store.pop(email, None)
-            return jsonify({'success': False, 'message': 'Could not send verification email.'}), 500
+            'otp': otp
+        })
+        mail_job_id = send_otp_email(email, otp)
+        return jsonify({
+            'success': True,
+            'message': 'Registration successful. Please check your email for the OTP.',
+            'mail_job_id': mail_job_id
+        })
+    except PasswordHasherBusy:
+        return auth_busy_response()
     except Exception as e:
         return jsonify({'success': False, 'message': f'Registration failed: {e}'}), 500
 
+# Lets the client poll whether the OTP email went out ('queued', 'sending', 'retrying', 'sent' or 'failed').
+@app.route('/register/mail-status/<job_id>', methods=['GET'])
+def get_mail_status(job_id):
+    job = mail_dispatcher.status(job_id)
+    if not job:
+        return jsonify({'success': False, 'message': 'Mail job not found.'}), 404
+    return jsonify({'success': True, 'status': job['status'], 'attempts': job['attempts']})
+
 @app.route('/verify-email', methods=['POST'])
+@rate_limiter.limit('verify_email', **RATE_LIMITS['verify_email'])
 def verify_email():
     try:
         data = request.get_json()
@@ -177,7 +653,7 @@ def verify_email():
             )
             db.session.add(new_user)
             db.session.commit()
-            otp_store.pop(email, None)
+            otp_store.pop(email)
             return jsonify({'success': True, 'message': 'Email verified successfully. You can now log in.'})
         else:
             return jsonify({'success': False, 'message': 'Invalid or expired OTP.'}), 401
@@ -185,55 +661,118 @@ def verify_email():
         return jsonify({'success': False, 'message': f'Verification failed: {e}'}), 500
 
 @app.route('/login', methods=['POST'])
+@rate_limiter.limit('login', **RATE_LIMITS['login'])
 def login():
     try:
         data = request.get_json()
         email, password = data['email'], data['password']
         user = User.query.filter_by(email=email).first()
-        if not user or not user.verified or not check_password_hash(user.password, password):
+        if not user or not user.verified or not password_hasher.verify(user.password, password):
             return jsonify({'success': False, 'message': 'Invalid credentials or account not verified.'}), 401
+        if password_hasher.needs_rehash(user.password):
+            # Upgrade hashes made with older parameters while we have the plain password.
+            try:
+                user.password = password_hasher.hash(password)
+                db.session.commit()
+            except PasswordHasherBusy:
+                pass # Try again on the next login
         return jsonify({
             'success': True,
             'message': 'Login successful.',
-            'user': {'id': user.id, 'name': user.name, 'email': user.email}
+            'user': {'id': user.id, 'name': user.name, 'email': user.email},
+            **token_service.issue(user.id, user.password)
         })
+    except PasswordHasherBusy:
+        return auth_busy_response()
     except Exception as e:
         return jsonify({'success': False, 'message': f'Login failed: {e}'}), 500
 
+# Body: {"refresh_token": "..."}. Returns a new access/refresh token pair.
+@app.route('/auth/refresh', methods=['POST'])
+def refresh_token():
+    try:
+        data = request.get_json() or {}
+        try:
+            user_id, fingerprint = token_service.load_refresh(data.get('refresh_token') or '')
+        except InvalidToken as e:
+            return jsonify({'success': False, 'message': str(e), 'token_expired': e.expired}), 401
+        user = User.query.get(user_id)
+        # A changed password invalidates refresh tokens issued before the change.
+        if not user or not user.verified or token_service.fingerprint(user.password) != fingerprint:
+            return jsonify({'success': False, 'message': 'Session is no longer valid. Please log in again.'}), 401
+        return jsonify({'success': True, **token_service.issue(user.id, user.password)})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Token refresh failed: {e}'}), 500
+
 
 # --- Lawyer Registration Routes (NEW) ---
 
 # This route is new and is needed by the admin panel to fetch the list of lawyers.
+# Optional query parameters:
+#   status, state_of_practice, city_of_practice, enrollment_year  - exact-match filters
+#   fields=id,full_name,...                                       - only return these fields
+#   limit=50&after=<next_cursor>                                  - keyset pagination, oldest first
 @app.route('/lawyers', methods=['GET'])
+@response_cache.cached('lawyers')
 def get_all_lawyers():
     try:
-        lawyers = Lawyer.query.all()
+        try:
+            limit = parse_page_size(request.args.get('limit'))
+            after = request.args.get('after')
+            cursor = decode_cursor(after) if after else None
+            enrollment_year = request.args.get('enrollment_year')
+            enrollment_year = int(enrollment_year) if enrollment_year else None
+        except ValueError:
+            return jsonify({'success': False, 'message': 'Invalid limit, cursor or enrollment year.'}), 400
+
+        fields = LAWYER_FIELDS
+        if request.args.get('fields'):
+            fields = [f for f in LAWYER_FIELDS if f in request.args['fields'].split(',')]
+            if not fields:
+                return jsonify({'success': False, 'message': 'No valid fields requested.'}), 400
+
+        # Only SELECT the requested columns (plus the two the cursor needs).
+        columns = [getattr(Lawyer, f) for f in fields]
+        for key in ('id', 'registration_date'):
+            if key not in fields:
+                columns.append(getattr(Lawyer, key))
+        query = db.session.query(*columns)
+
+        for name in ('status', 'state_of_practice', 'city_of_practice'):
+            if request.args.get(name):
+                query = query.filter(getattr(Lawyer, name) == request.args[name])
+        if enrollment_year is not None:
+            query = query.filter(Lawyer.enrollment_year == enrollment_year)
+        if cursor:
+            cursor_date, cursor_id = cursor
+            query = query.filter(or_(
+                Lawyer.registration_date > cursor_date,
+                and_(Lawyer.registration_date == cursor_date, Lawyer.id > cursor_id)
+            ))
+        query = query.order_by(Lawyer.registration_date.asc(), Lawyer.id.asc())
+        if limit:
+            query = query.limit(limit + 1)
+        rows = query.all()
+
+        next_cursor = None
+        if limit and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1].registration_date, rows[-1].id)
+
         lawyers_list = []
-        for lawyer in lawyers:
-            lawyers_list.append({
-                'id': lawyer.id,
-                'full_name': lawyer.full_name,
-                'email': lawyer.email,
-                'contact_number': lawyer.contact_number,
-                'bar_enrollment_number': lawyer.bar_enrollment_number,
-                'state_bar_council': lawyer.state_bar_council,
-                'enrollment_year': lawyer.enrollment_year,
-                'city_of_practice': lawyer.city_of_practice,
-                'state_of_practice': lawyer.state_of_practice,
-                'bio': lawyer.bio,
-                'profile_picture_path': lawyer.profile_picture_path,
-                'bar_id_card_path': lawyer.bar_id_card_path,
-                'enrollment_certificate_path': lawyer.enrollment_certificate_path,
-                'govt_id_path': lawyer.govt_id_path,
-                'status': lawyer.status,
-                'registration_date': lawyer.registration_date.isoformat()
-            })
-        return jsonify({'success': True, 'lawyers': lawyers_list}), 200
+        for row in rows:
+            lawyer = {}
+            for field in fields:
+                value = getattr(row, field)
+                lawyer[field] = value.isoformat() if field == 'registration_date' and value else value
+            lawyers_list.append(lawyer)
+        return jsonify({'success': True, 'lawyers': lawyers_list, 'next_cursor': next_cursor}), 200
     except Exception as e:
         return jsonify({'success': False, 'message': f'Failed to fetch lawyers: {e}'}), 500
 
 # This route handles the POST request from your React Native app.
 @app.route('/lawyers/register', methods=['POST'])
+@rate_limiter.limit('register_lawyer', **RATE_LIMITS['register_lawyer'])
 def register_lawyer():
     try:
         # Get text data from the form
@@ -249,7 +788,8 @@ def register_lawyer():
         bio = request.form.get('bio')
         
         # Check if a lawyer with this email or bar enrollment number already exists
-        if Lawyer.query.filter_by(email=email).first() or Lawyer.query.filter_by(bar_enrollment_number=bar_enrollment_number).first():
+        # Emails match case-insensitively, as in the bulk import (backed by ix_lawyer_email_lower).
+        if Lawyer.query.filter(func.lower(Lawyer.email) == (email or '').lower()).first() or Lawyer.query.filter_by(bar_enrollment_number=bar_enrollment_number).first():
             return jsonify({
                 'success': False,
                 'message': 'A lawyer with this email or bar enrollment number already exists.'
@@ -261,22 +801,17 @@ def register_lawyer():
         enrollment_certificate = request.files.get('enrollmentCertificate')
         govt_id = request.files.get('govtId')
         
-        file_paths = {}
-
-        # Save uploaded files
-        def save_file(file_obj, key_name):
+        # Files were already streamed to disk and hashed while the form was parsed;
+        # this just moves each one to its content-addressed path.
+        def save_file(file_obj):
             if file_obj:
-                filename = secure_filename(file_obj.filename)
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file_obj.save(file_path)
-                file_paths[key_name] = file_path
-                return filename # Return the filename, not the full path
+                return upload_storage.store(file_obj)
             return None
 
-        profile_pic_path = save_file(profile_picture, 'profilePicture_path')
-        bar_id_path = save_file(bar_id_card, 'barIdCard_path')
-        enrollment_cert_path = save_file(enrollment_certificate, 'enrollmentCertificate_path')
-        govt_id_path = save_file(govt_id, 'govtId_path')
+        profile_pic = save_file(profile_picture)
+        bar_id = save_file(bar_id_card)
+        enrollment_cert = save_file(enrollment_certificate)
+        govt_id_file = save_file(govt_id)
 
         # Create a new Lawyer object and save to the database
         new_lawyer = Lawyer(
@@ -289,20 +824,31 @@ def register_lawyer():
             city_of_practice=city_of_practice,
             state_of_practice=state_of_practice,
             bio=bio,
-            profile_picture_path=profile_pic_path,
-            bar_id_card_path=bar_id_path,
-            enrollment_certificate_path=enrollment_cert_path,
-            govt_id_path=govt_id_path,
+            profile_picture_path=profile_pic and profile_pic.path,
+            bar_id_card_path=bar_id and bar_id.path,
+            enrollment_certificate_path=enrollment_cert and enrollment_cert.path,
+            govt_id_path=govt_id_file and govt_id_file.path,
+            profile_picture_digest=profile_pic and profile_pic.digest,
+            bar_id_card_digest=bar_id and bar_id.digest,
+            enrollment_certificate_digest=enrollment_cert and enrollment_cert.digest,
+            govt_id_digest=govt_id_file and govt_id_file.digest,
             status='pending'
         )
         db.session.add(new_lawyer)
         db.session.commit()
+        response_cache.invalidate('lawyers')
+        # Small renditions for the admin panel's grid
+        for stored in (profile_pic, bar_id):
+            if stored:
+                thumbnail_generator.submit(stored.path)
 
         return jsonify({
             'success': True,
             'message': 'Registration data and files received successfully. Awaiting approval.'
         }), 200
 
+    except RequestEntityTooLarge:
+        return jsonify({'success': False, 'message': 'Uploaded files are too large.'}), 413
     except Exception as e:
         db.session.rollback()
         print('Error during registration:', e)
@@ -327,6 +873,8 @@ def update_lawyer_status(lawyer_id):
         
         lawyer.status = new_status
         db.session.commit()
+        response_cache.invalidate('lawyers')
+        reindex_lawyer_answers([lawyer.id])
 
         return jsonify({
             'success': True,
@@ -339,12 +887,165 @@ def update_lawyer_status(lawyer_id):
         db.session.rollback()
         return jsonify({'success': False, 'message': f'Failed to update lawyer status: {e}'}), 500
 
+# Batch variant for the admin panel.
+# Body: {"updates": [{"id": 1, "status": "approved"}, {"id": 2, "status": "rejected"}, ...]}
+# All valid items are applied in one transaction; every item gets its own result.
+@app.route('/lawyers/status', methods=['PATCH'])
+def update_lawyer_statuses():
+    try:
+        updates = (request.get_json() or {}).get('updates')
+        if not isinstance(updates, list) or not updates:
+            return jsonify({'success': False, 'message': 'A non-empty list of updates is required.'}), 400
+        if len(updates) > MAX_BATCH_SIZE:
+            return jsonify({'success': False, 'message': f'At most {MAX_BATCH_SIZE} updates per request.'}), 400
+
+        ids = [item.get('id') for item in updates if isinstance(item, dict)]
+        existing = {row[0] for row in db.session.query(Lawyer.id).filter(Lawyer.id.in_(ids))}
+
+        results, ids_by_status, seen = [], {}, set()
+        for item in updates:
+            lawyer_id = item.get('id') if isinstance(item, dict) else None
+            new_status = item.get('status') if isinstance(item, dict) else None
+            if new_status not in ['approved', 'rejected']:
+                results.append({'id': lawyer_id, 'success': False, 'message': 'Invalid status provided.'})
+            elif lawyer_id not in existing:
+                results.append({'id': lawyer_id, 'success': False, 'message': 'Lawyer not found.'})
+            elif lawyer_id in seen:
+                results.append({'id': lawyer_id, 'success': False, 'message': 'Duplicate id in batch.'})
+            else:
+                seen.add(lawyer_id)
+                ids_by_status.setdefault(new_status, []).append(lawyer_id)
+                results.append({'id': lawyer_id, 'success': True, 'new_status': new_status})
+
+        # One UPDATE ... WHERE id IN (...) per target status
+        for new_status, lawyer_ids in ids_by_status.items():
+            db.session.execute(update(Lawyer).where(Lawyer.id.in_(lawyer_ids)).values(status=new_status))
+        db.session.commit()
+        if seen:
+            response_cache.invalidate('lawyers')
+            reindex_lawyer_answers(list(seen))
+
+        return jsonify({'success': True, 'updated': len(seen), 'results': results}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': f'Failed to update lawyer statuses: {e}'}), 500
+
+
+# --- Bulk Lawyer Import/Export ---
+# POST /lawyers/import takes the whole file as the request body, e.g.
+#   curl --data-binary @lawyers.csv -H 'Content-Type: text/csv' http://.../lawyers/import
+# (or application/x-ndjson for JSONL; ?format=csv|jsonl overrides the Content-Type) and
+# returns counts plus the line number and reason for every row that was not imported.
+# Imported lawyers are always 'pending' here; only the CLI's --keep-status can import approvals.
+# Both endpoints need LAWYER_TRANSFER_TOKEN (see the configuration above).
+def lawyer_transfer_denied():
+    """Error response unless the request carries the bulk transfer token."""
+    if not LAWYER_TRANSFER_TOKEN:
+        return jsonify({'success': False, 'message': 'Bulk transfer over HTTP is disabled; use the flask CLI commands.'}), 403
+    if request.headers.get('Authorization') != f'Bearer {LAWYER_TRANSFER_TOKEN}':
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 401
+    return None
+
+@app.route('/lawyers/import', methods=['POST'])
+@rate_limiter.limit('import_lawyers', **RATE_LIMITS['import_lawyers'])
+def import_lawyers():
+    denied = lawyer_transfer_denied()
+    if denied:
+        return denied
+    try:
+        fmt = request.args.get('format') or lawyer_transfer.format_from_content_type(request.mimetype)
+        if fmt not in lawyer_transfer.FORMATS:
+            return jsonify({'success': False, 'message': 'Send text/csv or application/x-ndjson, or pass ?format=csv|jsonl.'}), 415
+        text_stream = io.TextIOWrapper(request.stream, encoding='utf-8-sig', newline='')
+        report = lawyer_transfer.import_lawyers(db.session, Lawyer, lawyer_transfer.read_rows(text_stream, fmt),
+                                                batch_size=LAWYER_TRANSFER_BATCH_SIZE)
+        if report.inserted:
+            response_cache.invalidate('lawyers')
+        return jsonify({'success': True, **report.to_dict()}), 200
+    except RequestEntityTooLarge:
+        return jsonify({'success': False, 'message': 'File is too large.'}), 413
+    except UnicodeDecodeError:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'File must be UTF-8 encoded.'}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': f'Import failed: {e}'}), 500
+
+# GET /lawyers/export?format=csv|jsonl streams the directory; optional status= and fields=
+# (same names as /lawyers) narrow it down.
+@app.route('/lawyers/export', methods=['GET'])
+def export_lawyers():
+    denied = lawyer_transfer_denied()
+    if denied:
+        return denied
+    fmt = request.args.get('format', 'csv')
+    if fmt not in lawyer_transfer.FORMATS:
+        return jsonify({'success': False, 'message': 'format must be csv or jsonl.'}), 400
+    fields = LAWYER_FIELDS
+    if 'fields' in request.args:
+        fields = [f for f in LAWYER_FIELDS if f in request.args['fields'].split(',')]
+        if not fields:
+            return jsonify({'success': False, 'message': 'No valid fields requested.'}), 400
+    chunks = lawyer_transfer.export_lawyers(db.session, Lawyer, fields, fmt, request.args.get('status'),
+                                            batch_size=LAWYER_TRANSFER_BATCH_SIZE)
+    response = Response(stream_with_context(chunks), mimetype=lawyer_transfer.FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename=lawyers.{fmt}'
+    return response
+
 
 # --- New Route to serve uploaded files ---
+# Supports conditional requests (ETag) and Range. ?size=thumb|medium serves a resized rendition
+# once the background generator has made it, and the original until then.
 @app.route('/uploads/<path:filename>')
 def get_file(filename):
     try:
-        return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+        upload_root = os.path.abspath(app.config['UPLOAD_FOLDER'])
+        # Reject paths that leave the upload folder before touching the filesystem.
+        safe_path = safe_join(upload_root, filename)
+        if safe_path is None:
+            raise FileNotFoundError(filename)
+        filename = os.path.relpath(safe_path, upload_root).replace(os.sep, '/')
+        size = request.args.get('size')
+        fallback = False # True while a requested rendition is not ready and the original is served
+        if size:
+            if size not in THUMBNAIL_SIZES:
+                return jsonify({'success': False, 'message': 'Unknown size.'}), 400
+            variant = thumbnail_generator.variant_path(filename, size)
+            if os.path.isfile(os.path.join(upload_root, variant)):
+                filename = variant
+            elif os.path.isfile(safe_path):
+                fallback = True
+                thumbnail_generator.submit(filename) # Backfill uploads made before thumbnails existed
+
+        # Content-addressed files get their digest as a strong ETag and may be cached forever.
+        stem = os.path.splitext(os.path.basename(filename))[0]
+        immutable = bool(CONTENT_ADDRESSED_NAME.match(stem))
+        etag = True # Let Werkzeug derive one from mtime/size for legacy files
+        if immutable:
+            etag = f'{stem}-{size}' if filename.startswith('variants/') else stem
+        max_age = UPLOAD_IMMUTABLE_MAX_AGE if immutable else UPLOAD_LEGACY_MAX_AGE
+        if fallback:
+            # Only a stand-in until the rendition exists; don't let the browser keep it.
+            immutable = False
+            max_age = UPLOAD_FALLBACK_MAX_AGE
+
+        if UPLOAD_SENDFILE_MODE == 'x-accel':
+            safe_path = os.path.abspath(os.path.join(upload_root, filename))
+            if not safe_path.startswith(upload_root + os.sep) or not os.path.isfile(safe_path):
+                raise FileNotFoundError(filename)
+            # nginx streams the file (and handles Range) from its internal location.
+            response = app.response_class(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+            response.headers['X-Accel-Redirect'] = UPLOAD_ACCEL_PREFIX + filename
+            response.cache_control.public = True
+            response.cache_control.max_age = max_age
+            if isinstance(etag, str):
+                response.set_etag(etag)
+                response = response.make_conditional(request)
+        else:
+            response = send_from_directory(upload_root, filename, conditional=True, etag=etag, max_age=max_age)
+        if immutable:
+            response.cache_control.immutable = True
+        return response
     except FileNotFoundError:
         return jsonify({'success': False, 'message': 'File not found.'}), 404
 
@@ -354,57 +1055,89 @@ def get_file(filename):
 def create_post():
     try:
         data = request.get_json()
-        user_id, content = data.get('user_id'), data.get('content')
-        if not user_id or not content:
-            return jsonify({'success': False, 'message': 'User ID and content are required.'}), 400
-        user = User.query.get(user_id)
+        content = data.get('content')
+        if not content:
+            return jsonify({'success': False, 'message': 'Content is required.'}), 400
+        user = acting_user(data)
         if not user:
-            return jsonify({'success': False, 'message': 'User not found.'}), 404
+            return auth_required_response()
         new_post = Post(
             content=content,
             location=data.get('location'),
             is_anonymous=data.get('is_anonymous', False),
-            user_id=user_id
+            user_id=user.id
         )
         db.session.add(new_post)
         db.session.commit()
+        response_cache.invalidate('posts')
+        event_bus.publish('posts', 'post_created', format_post(new_post, user.name))
         return jsonify({'success': True, 'message': 'Post created successfully.'}), 201
     except Exception as e:
         return jsonify({'success': False, 'message': f'Failed to create post: {e}'}), 500
 
 @app.route('/posts', methods=['GET'])
+@response_cache.cached('posts')
 def get_posts():
+    # Optional keyset pagination: ?limit=20&before=<next_cursor from the previous page>.
+    # Without ?limit the whole feed is returned, as before.
     try:
-        posts = Post.query.order_by(Post.timestamp.desc()).all()
+        try:
+            limit = parse_page_size(request.args.get('limit'))
+            before = request.args.get('before')
+            cursor = decode_cursor(before) if before else None
+        except ValueError:
+            return jsonify({'success': False, 'message': 'Invalid limit or cursor.'}), 400
+
+        # One query for the page: author name via JOIN, comment count from the stored counter.
+        query = db.session.query(Post, User.name) \
+            .join(User, Post.user_id == User.id)
+        if cursor:
+            cursor_timestamp, cursor_id = cursor
+            query = query.filter(or_(
+                Post.timestamp < cursor_timestamp,
+                and_(Post.timestamp == cursor_timestamp, Post.id < cursor_id)
+            ))
+        query = query.order_by(Post.timestamp.desc(), Post.id.desc())
+        if limit:
+            # Fetch one extra row to know whether another page exists.
+            query = query.limit(limit + 1)
+        rows = query.all()
+
+        next_cursor = None
+        if limit and len(rows) > limit:
+            rows = rows[:limit]
+            last_post = rows[-1][0]
+            next_cursor = encode_cursor(last_post.timestamp, last_post.id)
+
         result = []
-        for post in posts:
-            result.append({
-                'id': post.id,
-                'content': post.content,
-                'timestamp': post.timestamp.isoformat(),
-                'location': post.location,
-                'is_anonymous': post.is_anonymous,
-                'author': "Anonymous" if post.is_anonymous else post.author.name,
-                'user_id': post.user_id,
-                # --- NEW: Include comment count ---
-                'comment_count': len(post.comments)
-            })
-        return jsonify({'success': True, 'posts': result})
+        for post, author_name in rows:
+            result.append(format_post(post, author_name))
+        return jsonify({'success': True, 'posts': result, 'next_cursor': next_cursor})
     except Exception as e:
         return jsonify({'success': False, 'message': f'Failed to fetch posts: {e}'}), 500
 
 @app.route('/posts/<int:post_id>', methods=['DELETE'])
 def delete_post(post_id):
     try:
-        post = Post.query.get(post_id)
-        if not post:
+        user = acting_user(request.get_json(silent=True))
+        if not user:
+            return auth_required_response()
+        post_author_id = db.session.query(Post.user_id).filter_by(id=post_id).scalar()
+        if post_author_id is None:
             return jsonify({'success': False, 'message': 'Post not found.'}), 404
-        # Optional: Add check to ensure only the author can delete
-        # data = request.get_json()
-        # if post.user_id != data.get('user_id'):
-        #     return jsonify({'message': 'Permission denied.'}), 403
-        db.session.delete(post)
+        # Only the author can delete a post
+        if post_author_id != user.id:
+            return jsonify({'success': False, 'message': 'Permission denied.'}), 403
+
+        # Bulk deletes instead of the ORM cascade, which would load every comment and like first.
+        post_comments = select(Comment.id).where(Comment.post_id == post_id)
+        db.session.execute(delete(comment_likes).where(comment_likes.c.comment_id.in_(post_comments)))
+        db.session.execute(delete(Comment).where(Comment.post_id == post_id))
+        db.session.execute(delete(Post).where(Post.id == post_id))
         db.session.commit()
+        response_cache.invalidate('posts', f'comments:{post_id}')
+        event_bus.publish('posts', 'post_deleted', {'post_id': post_id})
+        event_bus.publish(f'post:{post_id}', 'post_deleted', {'post_id': post_id})
         return jsonify({'success': True, 'message': 'Post deleted successfully.'}), 200
     except Exception as e:
         return jsonify({'success': False, 'message': f'Could not delete post: {e}'}), 500
@@ -412,36 +1145,156 @@ def delete_post(post_id):
 # --- Comment Routes ---
 
 # --- MODIFIED: Get Comments to handle nesting ---
-def format_comment(comment, current_user_id):
-    user_has_liked = any(user.id == current_user_id for user in comment.likes)
+def format_comment(comment, author_name, like_count=0, user_has_liked=False):
+    if comment.is_deleted:
+        # Tombstone: keeps its place in the thread but shows nothing of the original
+        return {
+            'id': comment.id,
+            'content': '[deleted]',
+            'timestamp': comment.timestamp.isoformat(),
+            'author': '[deleted]',
+            'user_id': None,
+            'post_id': comment.post_id,
+            'parent_id': comment.parent_id,
+            'like_count': 0,
+            'user_has_liked': False,
+            'is_deleted': True,
+            'replies': []
+        }
     return {
         'id': comment.id,
         'content': comment.content,
         'timestamp': comment.timestamp.isoformat(),
-        'author': comment.author.name,
+        'author': author_name,
         'user_id': comment.user_id,
         'post_id': comment.post_id,
         'parent_id': comment.parent_id,
-        'like_count': len(comment.likes),
+        'like_count': like_count,
         'user_has_liked': user_has_liked, # <-- The important new field
-        'replies': [format_comment(reply, current_user_id) for reply in comment.replies]
+        'replies': []
     }
 
+def comment_subtree(comment_id):
+    """Recursive CTE selecting the ids of a comment and all of its replies, at any depth."""
+    subtree = select(Comment.id).where(Comment.id == comment_id).cte('subtree', recursive=True)
+    subtree = subtree.union_all(select(Comment.id).where(Comment.parent_id == subtree.c.id))
+    return select(subtree.c.id)
+
+def prune_tombstones(comment_id):
+    """Deletes the tombstone `comment_id` and its tombstoned ancestors once they have no replies left.
+
+    Returns the ids that were removed, nearest first.
+    """
+    pruned = []
+    while comment_id is not None:
+        row = db.session.query(Comment.parent_id, Comment.is_deleted).filter(Comment.id == comment_id).first()
+        if not row or not row.is_deleted:
+            break
+        if db.session.query(Comment.id).filter_by(parent_id=comment_id).first() is not None:
+            break
+        db.session.execute(delete(Comment).where(Comment.id == comment_id))
+        pruned.append(comment_id)
+        comment_id = row.parent_id
+    return pruned
+
+def build_comment_tree(post_id, current_user_id, max_depth=None, limit=None, cursor=None):
+    """Loads a page of top-level comments and their replies and nests them in memory.
+
+    The page of top-level comments is picked in SQL (keyset on (timestamp, id), `limit` rows
+    after `cursor`), then a recursive query loads only their replies, down to max_depth
+    (top-level comments are depth 0). Author names and the current user's like flag come from
+    the same statement and like counts are read from the stored counter, so the query count
+    does not grow with the size of the thread. Replies deeper than max_depth are left out and
+    their parent is flagged with 'has_more_replies'.
+
+    Returns (top-level comments, cursor of the next page or None).
+    """
+    if max_depth is not None:
+        max_depth = max(max_depth, 0)
+    roots = and_(Comment.post_id == post_id, Comment.parent_id.is_(None))
+    next_cursor = None
+    if limit or cursor:
+        page = db.session.query(Comment.id, Comment.timestamp).filter(roots)
+        if cursor:
+            cursor_timestamp, cursor_id = cursor
+            page = page.filter(or_(
+                Comment.timestamp > cursor_timestamp,
+                and_(Comment.timestamp == cursor_timestamp, Comment.id > cursor_id)
+            ))
+        page = page.order_by(Comment.timestamp.asc(), Comment.id.asc())
+        if limit:
+            # Fetch one extra row to know whether another page exists.
+            page = page.limit(limit + 1)
+        page_rows = page.all()
+        if limit and len(page_rows) > limit:
+            page_rows = page_rows[:limit]
+            next_cursor = encode_cursor(page_rows[-1].timestamp, page_rows[-1].id)
+        if not page_rows:
+            return [], None
+        roots = Comment.id.in_([row.id for row in page_rows])
+
+    # One level past max_depth is loaded too, only to flag parents that have more replies.
+    thread = select(Comment.id, literal(0).label('depth')).where(roots).cte('thread', recursive=True)
+    step = select(Comment.id, thread.c.depth + 1).where(Comment.parent_id == thread.c.id)
+    if max_depth is not None:
+        step = step.where(thread.c.depth <= max_depth)
+    thread = thread.union_all(step)
+
+    my_likes = comment_likes.alias('my_likes')
+    rows = db.session.query(
+        Comment,
+        User.name,
+        my_likes.c.comment_id.isnot(None),
+        thread.c.depth
+    ).join(thread, thread.c.id == Comment.id) \
+        .join(User, Comment.user_id == User.id) \
+        .outerjoin(my_likes, and_(my_likes.c.comment_id == Comment.id, my_likes.c.user_id == current_user_id)) \
+        .order_by(Comment.timestamp.asc(), Comment.id.asc()) \
+        .all()
+
+    # Index every node first, then attach children, so a reply whose timestamp sorts before
+    # its parent's is still placed under it.
+    nodes = {}
+    for comment, author_name, user_has_liked, depth in rows:
+        if max_depth is None or depth <= max_depth:
+            nodes[comment.id] = format_comment(comment, author_name, comment.like_count, bool(user_has_liked))
+    top_level = []
+    for comment, _, _, depth in rows:
+        if comment.parent_id is None:
+            top_level.append(nodes[comment.id])
+        elif comment.id in nodes:
+            nodes[comment.parent_id]['replies'].append(nodes[comment.id])
+        else:
+            nodes[comment.parent_id]['has_more_replies'] = True
+    return top_level, next_cursor
+
     # --- MODIFIED: Get Comments route ---
 @app.route('/posts/<int:post_id>/comments', methods=['GET'])
+@response_cache.cached('comments:{post_id}', vary=lambda: g.current_user.id if g.current_user else '')
 def get_comments(post_id):
+    # Optional: ?depth= caps reply nesting, ?limit=&after= pages through top-level comments.
     try:
-        # Get user_id from URL query parameters (e.g., ?user_id=123)
-        current_user_id = request.args.get('user_id', type=int)
+        # From the access token, or from the URL for older clients (e.g., ?user_id=123).
+        # Only used to mark which comments this user has liked, so it is not looked up.
+        if g.current_user:
+            current_user_id = g.current_user.id
+        elif not AUTH_REQUIRE_TOKENS:
+            current_user_id = request.args.get('user_id', type=int)
+        else:
+            current_user_id = None
         if not current_user_id:
             return jsonify({'success': False, 'message': 'User ID is required.'}), 400
 
-        top_level_comments = Comment.query.filter_by(post_id=post_id, parent_id=None).order_by(Comment.timestamp.asc()).all()
-        
-        # Pass the user ID to the formatter
-        result = [format_comment(comment, current_user_id) for comment in top_level_comments]
-        
-        return jsonify({'success': True, 'comments': result})
+        try:
+            max_depth = request.args.get('depth', type=int)
+            limit = parse_page_size(request.args.get('limit'))
+            after = request.args.get('after')
+            cursor = decode_cursor(after) if after else None
+        except ValueError:
+            return jsonify({'success': False, 'message': 'Invalid limit or cursor.'}), 400
+
+        result, next_cursor = build_comment_tree(post_id, current_user_id, max_depth, limit, cursor)
+        return jsonify({'success': True, 'comments': result, 'next_cursor': next_cursor})
     except Exception as e:
         print(f"❌ Error in /posts/<id>/comments (GET): {e}")
         return jsonify({'success': False, 'message': 'Failed to fetch comments.'}), 500
@@ -451,32 +1304,43 @@ def get_comments(post_id):
 def create_comment(post_id):
     try:
         data = request.get_json()
-        user_id = data.get('user_id')
         content = data.get('content')
         parent_id = data.get('parent_id') # For replies
 
-        if not user_id or not content:
-            return jsonify({'success': False, 'message': 'User ID and content are required.'}), 400
+        if not content:
+            return jsonify({'success': False, 'message': 'Content is required.'}), 400
 
-        user = User.query.get(user_id)
-        post = Post.query.get(post_id)
-        if not user or not post:
-            return jsonify({'success': False, 'message': 'User or Post not found.'}), 404
+        user = acting_user(data)
+        if not user:
+            return auth_required_response()
+        question = db.session.query(Post.content).filter_by(id=post_id).scalar()
+        if question is None:
+            return jsonify({'success': False, 'message': 'Post not found.'}), 404
 
         new_comment = Comment(
             content=content,
-            user_id=user_id,
+            user_id=user.id,
             post_id=post_id,
             parent_id=parent_id # Will be None if it's a top-level comment
         )
         db.session.add(new_comment)
+        db.session.execute(update(Post).where(Post.id == post_id).values(comment_count=Post.comment_count + 1))
         db.session.commit()
+        response_cache.invalidate('posts', f'comments:{post_id}')
+        formatted = format_comment(new_comment, user.name)
+        event_bus.publish(f'post:{post_id}', 'comment_created', formatted)
+        publish_comment_count(post_id)
+        # Answers from approved lawyers become searchable through /ask right away
+        lawyer_name = db.session.query(Lawyer.full_name).filter_by(email=user.email, status='approved').scalar()
+        if lawyer_name:
+            rights_index.add(answer_document(new_comment, question, lawyer_name))
+            record_rights_index_changes([new_comment.id])
         
         # Return the formatted comment, including its empty replies array
         return jsonify({
             'success': True, 
             'message': 'Comment created successfully.',
-            'comment': format_comment(new_comment)
+            'comment': formatted
         }), 201
     except Exception as e:
         return jsonify({'success': False, 'message': f'Failed to create comment: {e}'}), 500
@@ -485,20 +1349,48 @@ def create_comment(post_id):
 @app.route('/comments/<int:comment_id>', methods=['DELETE'])
 def delete_comment(comment_id):
     try:
-        data = request.get_json()
-        user_id = data.get('user_id') # The ID of the user trying to delete
+        user = acting_user(request.get_json(silent=True)) # The user trying to delete
+        if not user:
+            return auth_required_response()
+        user_id = user.id
 
-        comment = Comment.query.get(comment_id)
-        if not comment:
+        row = db.session.query(Comment.user_id, Comment.post_id, Comment.is_deleted, Post.user_id, Comment.parent_id) \
+            .join(Post, Comment.post_id == Post.id) \
+            .filter(Comment.id == comment_id).first()
+        if not row or row[2]:
             return jsonify({'success': False, 'message': 'Comment not found.'}), 404
-        
+        comment_author_id, post_id, _, post_author_id, parent_id = row
+
         # Security check: only the author of the comment or the author of the post can delete it
-        post_author_id = comment.post.user_id
-        if comment.user_id != user_id and post_author_id != user_id:
+        if comment_author_id != user_id and post_author_id != user_id:
             return jsonify({'success': False, 'message': 'Permission denied.'}), 403
 
-        db.session.delete(comment)
+        db.session.execute(delete(comment_likes).where(comment_likes.c.comment_id == comment_id))
+        has_replies = db.session.query(Comment.id).filter_by(parent_id=comment_id).first() is not None
+        tombstone = COMMENT_DELETE_MODE == 'tombstone' and has_replies
+        pruned = []
+        if tombstone:
+            # Keep the node so its replies stay where they are; the FTS trigger drops the old text.
+            db.session.execute(update(Comment).where(Comment.id == comment_id).values(
+                is_deleted=True, content='', like_count=0
+            ))
+            removed = 1
+        else:
+            # Remove the comment and its whole reply tree in bulk. Tombstones in it were already
+            # taken off the post's comment count.
+            subtree = comment_subtree(comment_id)
+            removed = db.session.query(func.count(Comment.id)) \
+                .filter(Comment.id.in_(subtree), Comment.is_deleted.is_(False)).scalar()
+            db.session.execute(delete(comment_likes).where(comment_likes.c.comment_id.in_(subtree)))
+            db.session.execute(delete(Comment).where(Comment.id.in_(subtree)))
+            pruned = prune_tombstones(parent_id)
+        db.session.execute(update(Post).where(Post.id == post_id).values(comment_count=Post.comment_count - removed))
         db.session.commit()
+        response_cache.invalidate('posts', f'comments:{post_id}')
+        event_bus.publish(f'post:{post_id}', 'comment_deleted', {'comment_id': comment_id, 'tombstone': tombstone})
+        for pruned_id in pruned:
+            event_bus.publish(f'post:{post_id}', 'comment_deleted', {'comment_id': pruned_id, 'tombstone': False})
+        publish_comment_count(post_id)
         return jsonify({'success': True, 'message': 'Comment deleted successfully.'}), 200
     except Exception as e:
         db.session.rollback()
@@ -508,36 +1400,212 @@ def delete_comment(comment_id):
 @app.route('/comments/<int:comment_id>/like', methods=['POST'])
 def toggle_like_comment(comment_id):
     try:
-        data = request.get_json()
-        user_id = data.get('user_id')
-
-        user = User.query.get(user_id)
+        user = acting_user(request.get_json(silent=True))
+        if not user:
+            return auth_required_response()
+        user_id = user.id
         comment = Comment.query.get(comment_id)
-        if not user or not comment:
-            return jsonify({'success': False, 'message': 'User or Comment not found.'}), 404
-
-        message = ''
-        if user in comment.likes:
-            # User has already liked it, so unlike it
-            comment.likes.remove(user)
-            message = 'Comment unliked.'
+        if not comment or comment.is_deleted:
+            return jsonify({'success': False, 'message': 'Comment not found.'}), 404
+
+        # Try to remove the like first; if there was nothing to remove, add it instead.
+        # Either way it is one write on comment_likes plus an atomic counter update.
+        removed = db.session.execute(comment_likes.delete().where(
+            comment_likes.c.user_id == user_id,
+            comment_likes.c.comment_id == comment_id
+        )).rowcount
+        if removed:
+            delta, message = -1, 'Comment unliked.'
         else:
-            # User has not liked it, so like it
-            comment.likes.append(user)
-            message = 'Comment liked.'
-        
+            db.session.execute(comment_likes.insert().values(user_id=user_id, comment_id=comment_id))
+            delta, message = 1, 'Comment liked.'
+        db.session.execute(update(Comment).where(Comment.id == comment_id).values(like_count=Comment.like_count + delta))
         db.session.commit()
 
+        like_count = db.session.query(Comment.like_count).filter_by(id=comment_id).scalar()
+        response_cache.invalidate(f'comments:{comment.post_id}')
+        event_bus.publish(f'post:{comment.post_id}', 'like_count', {'comment_id': comment_id, 'like_count': like_count})
         return jsonify({
             'success': True,
             'message': message,
-            'like_count': len(comment.likes)
+            'like_count': like_count
         }), 200
+    except IntegrityError:
+        # A concurrent request from the same user inserted the like first.
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'Like status changed concurrently, please retry.'}), 409
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': f'Failed to update like status: {e}'}), 500
+
+
+# --- NEW: Batch Like/Unlike Route ---
+# Body: {"comment_ids": [4, 8, 15]} (plus "user_id" from clients without tokens) toggles the user's like on each comment,
+# like POST /comments/<id>/like would, but with a fixed number of statements and one commit.
+@app.route('/comments/likes', methods=['POST'])
+def toggle_like_comments():
+    try:
+        data = request.get_json() or {}
+        comment_ids = data.get('comment_ids')
+        if not isinstance(comment_ids, list) or not comment_ids:
+            return jsonify({'success': False, 'message': 'A non-empty list of comment ids is required.'}), 400
+        if len(comment_ids) > MAX_BATCH_SIZE:
+            return jsonify({'success': False, 'message': f'At most {MAX_BATCH_SIZE} toggles per request.'}), 400
+        user = acting_user(data)
+        if not user:
+            return auth_required_response()
+        user_id = user.id
+
+        comments = {row.id: row.post_id for row in db.session.query(Comment.id, Comment.post_id)
+                    .filter(Comment.id.in_(comment_ids), Comment.is_deleted.is_(False))}
+        liked = {row[0] for row in db.session.query(comment_likes.c.comment_id).filter(
+            comment_likes.c.user_id == user_id, comment_likes.c.comment_id.in_(list(comments))
+        )}
+
+        results, to_like, to_unlike, seen = [], [], [], set()
+        for comment_id in comment_ids:
+            if comment_id not in comments:
+                results.append({'comment_id': comment_id, 'success': False, 'message': 'Comment not found.'})
+            elif comment_id in seen:
+                results.append({'comment_id': comment_id, 'success': False, 'message': 'Duplicate comment id in batch.'})
+            else:
+                seen.add(comment_id)
+                (to_unlike if comment_id in liked else to_like).append(comment_id)
+                results.append({'comment_id': comment_id, 'success': True, 'liked': comment_id not in liked})
+
+        if to_unlike:
+            db.session.execute(delete(comment_likes).where(
+                comment_likes.c.user_id == user_id, comment_likes.c.comment_id.in_(to_unlike)
+            ))
+        if to_like:
+            db.session.execute(comment_likes.insert(), [{'user_id': user_id, 'comment_id': cid} for cid in to_like])
+        if seen:
+            db.session.execute(update(Comment).where(Comment.id.in_(list(seen))).values(
+                like_count=Comment.like_count + case((Comment.id.in_(to_like), 1), else_=-1)
+            ))
+        db.session.commit()
+
+        like_counts = dict(db.session.query(Comment.id, Comment.like_count).filter(Comment.id.in_(list(seen)))) if seen else {}
+        for result in results:
+            if result['success']:
+                result['like_count'] = like_counts[result['comment_id']]
+        for post_id in {comments[cid] for cid in seen}:
+            response_cache.invalidate(f'comments:{post_id}')
+        for cid in seen:
+            event_bus.publish(f'post:{comments[cid]}', 'like_count', {'comment_id': cid, 'like_count': like_counts[cid]})
+
+        return jsonify({'success': True, 'results': results}), 200
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'Like status changed concurrently, please retry.'}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': f'Failed to update like status: {e}'}), 500
 
     
+# --- Live Updates Route ---
+# Server-Sent Events. GET /stream gets feed events ('post_created', 'post_deleted',
+# 'comment_count'); GET /stream?post_id=12 also gets that thread's events ('comment_created',
+# 'comment_deleted', 'like_count'). 'resync' means events were dropped: refetch, then reconnect.
+# Each open stream holds a worker thread, so run with a threaded or gevent server.
+@app.route('/stream', methods=['GET'])
+def stream():
+    topics = ['posts']
+    post_id = request.args.get('post_id', type=int)
+    if post_id:
+        topics.append(f'post:{post_id}')
+    subscription = event_bus.subscribe(topics)
+
+    def generate():
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                event = subscription.get(timeout=STREAM_KEEPALIVE_SECONDS)
+                if subscription.overflowed:
+                    yield 'event: resync\ndata: {}\n\n'
+                    return
+                if event is None:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+        finally:
+            subscription.close()
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no' # Stop nginx from buffering the stream
+    })
+
+
+# --- Search Route ---
+# GET /search?q=<text>&type=posts|comments|lawyers&limit=20&offset=0
+@app.route('/search', methods=['GET'])
+def search():
+    try:
+        if not search_index.is_supported(db.engine):
+            return jsonify({'success': False, 'message': 'Search is not available on this database.'}), 501
+        query = request.args.get('q', '').strip()
+        kind = request.args.get('type', 'posts')
+        if not query:
+            return jsonify({'success': False, 'message': 'Search query is required.'}), 400
+        if kind not in search_index.SEARCH_SQL:
+            return jsonify({'success': False, 'message': 'Invalid search type.'}), 400
+        try:
+            limit = parse_page_size(request.args.get('limit')) or DEFAULT_PAGE_SIZE
+            offset = max(0, int(request.args.get('offset', 0)))
+        except ValueError:
+            return jsonify({'success': False, 'message': 'Invalid limit or offset.'}), 400
+
+        results = search_index.search(db.session, kind, query, limit=limit, offset=offset)
+        for hit in results:
+            if hit.get('timestamp'):
+                hit['timestamp'] = datetime.fromisoformat(str(hit['timestamp'])).isoformat()
+            if 'is_anonymous' in hit:
+                hit['is_anonymous'] = bool(hit['is_anonymous'])
+                if hit['is_anonymous']:
+                    hit['author'] = 'Anonymous'
+        next_offset = offset + limit if len(results) == limit else None
+        return jsonify({'success': True, 'type': kind, 'results': results, 'next_offset': next_offset})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Search failed: {e}'}), 500
+
+
+
+# --- Rights Q&A Route ---
+# GET /ask?q=<question>&limit=5 returns the passages from the rights knowledge base and approved
+# lawyers' forum answers that best match the question, best first. Nothing leaves the server.
+@app.route('/ask', methods=['GET'])
+def ask():
+    question = request.args.get('q', '').strip()
+    if not question:
+        return jsonify({'success': False, 'message': 'A question is required.'}), 400
+    try:
+        limit = min(max(request.args.get('limit', 5, type=int), 1), ASK_MAX_RESULTS)
+        apply_rights_index_changes() # Answers added or dropped by other workers
+        answers = rights_index.search(question, limit)
+
+        # Forum answers may have been deleted since they were indexed (possibly by another worker).
+        forum_ids = [a['comment_id'] for a in answers if a['source'] == 'forum']
+        if forum_ids:
+            alive = {cid for (cid,) in db.session.query(Comment.id)
+                     .filter(Comment.id.in_(forum_ids), Comment.is_deleted.is_(False))}
+            for comment_id in set(forum_ids) - alive:
+                rights_index.remove(f'comment:{comment_id}')
+            answers = [a for a in answers if a['source'] != 'forum' or a['comment_id'] in alive]
+
+        return jsonify({'success': True, 'question': question, 'answers': answers, 'disclaimer': ASK_DISCLAIMER})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Failed to answer: {e}'}), 500
+
+
+# --- Metrics Route ---
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    if METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 401
+    return Response(request_metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
 # --- Run App ---
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5001)
@@ -0,0 +1,90 @@
+# Signed, stateless session tokens and a small cache of user records.
+#
+# /login hands out a short-lived access token and a long-lived refresh token, both signed with
+# the app's SECRET_KEY (itsdangerous), so checking one needs no database lookup. Clients send
+# "Authorization: Bearer <access token>" and trade the refresh token at /auth/refresh for a new
+# pair when the access token expires. Refresh tokens carry a fingerprint of the password hash,
+# so changing the password ends every existing session at its next refresh.
+#
+# UserCache keeps recently seen users in memory (LRU with a TTL) so resolving the token's user
+# on every request does not cost a SELECT.
+
+import hashlib
+from dataclasses import dataclass
+
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+
+from response_cache import LRUCache
+
+
+class InvalidToken(Exception):
+    """Raised for tokens that are malformed, tampered with or expired."""
+
+    def __init__(self, message, expired=False):
+        super().__init__(message)
+        self.expired = expired
+
+
+class TokenService:
+    def __init__(self, secret_key, access_ttl=15 * 60, refresh_ttl=30 * 24 * 3600):
+        self.access_ttl = access_ttl
+        self.refresh_ttl = refresh_ttl
+        # Different salts, so an access token is never accepted as a refresh token or vice versa.
+        self._access = URLSafeTimedSerializer(secret_key, salt='kyr-access')
+        self._refresh = URLSafeTimedSerializer(secret_key, salt='kyr-refresh')
+
+    @staticmethod
+    def fingerprint(password_hash):
+        return hashlib.sha256(password_hash.encode()).hexdigest()[:16]
+
+    def issue(self, user_id, password_hash):
+        return {
+            'access_token': self._access.dumps({'uid': user_id}),
+            'refresh_token': self._refresh.dumps({'uid': user_id, 'pwd': self.fingerprint(password_hash)}),
+            'expires_in': self.access_ttl
+        }
+
+    def load_access(self, token):
+        """Returns the user id of a valid access token."""
+        return self._load(self._access, token, self.access_ttl)['uid']
+
+    def load_refresh(self, token):
+        """Returns (user id, password fingerprint) of a valid refresh token."""
+        payload = self._load(self._refresh, token, self.refresh_ttl)
+        return payload['uid'], payload['pwd']
+
+    @staticmethod
+    def _load(serializer, token, max_age):
+        try:
+            return serializer.loads(token, max_age=max_age)
+        except SignatureExpired:
+            raise InvalidToken('Token expired.', expired=True)
+        except BadSignature:
+            raise InvalidToken('Invalid token.')
+
+
+@dataclass(frozen=True)
+class CachedUser:
+    id: int
+    name: str
+    email: str
+
+
+class UserCache:
+    """Read-through cache of CachedUser records; `loader(user_id)` fetches one on a miss."""
+
+    def __init__(self, loader, max_entries=10000, ttl=300):
+        self.loader = loader
+        self._cache = LRUCache(max_entries=max_entries, ttl=ttl)
+
+    def get(self, user_id):
+        user = self._cache.get(user_id)
+        if user is None:
+            # Misses are not cached, so a user who just verified their email is found right away.
+            user = self.loader(user_id)
+            if user is not None:
+                self._cache.set(user_id, user)
+        return user
+
+    def invalidate(self, user_id):
+        self._cache.delete(user_id)
@@ -0,0 +1,326 @@
+# Load-test / benchmark harness for the Flask API.
+#
+# Seeds a throwaway database with synthetic users, posts, nested comments, likes and lawyers,
+# starts the real app on a local port and drives it with concurrent HTTP clients. For each
+# scenario it reports p50/p95/p99 latency, throughput, errors and SQL queries per request, and
+# writes everything to a JSON file so runs on different commits can be compared.
+#
+# Usage:
+#   python benchmark.py --scale 10k --concurrency 16 --requests 2000 --output bench.json
+#   python benchmark.py --scale 10k --output new.json --compare bench.json
+#   python benchmark.py --database-url postgresql://... --scale 100k
+#
+# Outgoing email is stubbed out. Password hashing is real, so the login numbers are meaningful.
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import itertools
+import tempfile
+import threading
+import subprocess
+import http.client
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import text
+
+# Scale name -> number of posts; everything else is derived from it in seed_counts()
+SCALES = {'1k': 1_000, '10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+SCENARIOS = ['get_posts', 'get_comments', 'toggle_like_comment', 'login', 'register_lawyer']
+BENCH_PASSWORD = 'benchmark-password'
+INSERT_CHUNK = 5_000
+
+
+def seed_counts(posts):
+    return {
+        'users': max(100, posts // 10),
+        'posts': posts,
+        'comments_per_post': 5,
+        'likes': posts * 2,
+        'lawyers': max(100, posts // 10),
+    }
+
+
+# --- Seeding ---
+def insert_chunked(conn, table, rows):
+    """Inserts rows from an iterable INSERT_CHUNK at a time, so only one chunk is ever in memory."""
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, INSERT_CHUNK))
+        if not chunk:
+            return
+        conn.execute(table.insert(), chunk)
+
+
+def generate_comments(counts, max_depth, rng, words, now):
+    comment_id = 0
+    for post_id in range(1, counts['posts'] + 1):
+        depths = {}
+        for position in range(counts['comments_per_post']):
+            comment_id += 1
+            # Reply to an earlier comment of the same post half of the time, up to max_depth.
+            candidates = [cid for cid, depth in depths.items() if depth < max_depth]
+            parent_id = rng.choice(candidates) if candidates and rng.random() < 0.5 else None
+            depths[comment_id] = depths[parent_id] + 1 if parent_id else 0
+            yield {
+                'id': comment_id, 'content': ' '.join(rng.choices(words, k=12)),
+                'user_id': rng.randint(1, counts['users']), 'post_id': post_id, 'parent_id': parent_id,
+                # Later comments of a post are always newer, so a reply never predates its parent.
+                'timestamp': now - timedelta(seconds=counts['posts'] - post_id) + timedelta(milliseconds=position),
+                'like_count': 0, 'is_deleted': False
+            }
+
+
+def generate_likes(counts, total_comments, rng):
+    """About counts['likes'] likes spread over the comments; distinct users per comment, so no
+    (user, comment) pair repeats and nothing has to be remembered across comments."""
+    per_comment, remainder = divmod(counts['likes'], total_comments)
+    for comment_id in range(1, total_comments + 1):
+        k = min(per_comment + (rng.random() < remainder / total_comments), counts['users'])
+        for user_id in rng.sample(range(1, counts['users'] + 1), k):
+            yield {'user_id': user_id, 'comment_id': comment_id}
+
+
+def seed(app_module, counts, max_depth, rng):
+    """Bulk-inserts synthetic data with explicit ids so replies can point at their parents.
+
+    Rows are generated lazily and inserted a chunk at a time, so memory stays flat at any scale.
+    """
+    db = app_module.db
+    words = ('rights tenant landlord police FIR bail salary employer consumer complaint deposit '
+             'court notice lawyer property harassment refund insurance arrest warrant').split()
+    now = datetime.now(timezone.utc)
+    # One real hash shared by every user keeps seeding fast while /login still verifies it.
+    password_hash = app_module.password_hasher.hash(BENCH_PASSWORD)
+    total_comments = counts['posts'] * counts['comments_per_post']
+
+    with app_module.app.app_context(), db.engine.begin() as conn:
+        insert_chunked(conn, app_module.User.__table__, (
+            {'id': i, 'name': f'User {i}', 'email': f'user{i}@bench.test', 'password': password_hash, 'verified': True}
+            for i in range(1, counts['users'] + 1)
+        ))
+        insert_chunked(conn, app_module.Post.__table__, (
+            {'id': i, 'content': ' '.join(rng.choices(words, k=25)), 'user_id': rng.randint(1, counts['users']),
+             'timestamp': now - timedelta(seconds=counts['posts'] - i), 'is_anonymous': rng.random() < 0.2,
+             'comment_count': 0}
+            for i in range(1, counts['posts'] + 1)
+        ))
+        insert_chunked(conn, app_module.Comment.__table__, generate_comments(counts, max_depth, rng, words, now))
+        insert_chunked(conn, app_module.comment_likes, generate_likes(counts, total_comments, rng))
+        insert_chunked(conn, app_module.Lawyer.__table__, (
+            {'id': i, 'full_name': f'Lawyer {i}', 'email': f'lawyer{i}@bench.test', 'bar_enrollment_number': f'BAR/{i}',
+             'city_of_practice': rng.choice(['Delhi', 'Mumbai', 'Chennai', 'Kolkata', 'Bengaluru']),
+             'state_of_practice': 'State', 'enrollment_year': rng.randint(1990, 2024),
+             'bio': ' '.join(rng.choices(words, k=30)), 'bar_id_card_path': 'seed.jpeg',
+             'status': rng.choice(['pending', 'approved', 'rejected']), 'registration_date': now - timedelta(minutes=i)}
+            for i in range(1, counts['lawyers'] + 1)
+        ))
+
+        if conn.dialect.name == 'postgresql':
+            # Explicit ids do not advance SERIAL sequences; move them past the seeded rows so the
+            # app's own inserts (e.g. register_lawyer) don't collide with them.
+            for model in (app_module.User, app_module.Post, app_module.Comment, app_module.Lawyer):
+                table = conn.dialect.identifier_preparer.format_table(model.__table__)
+                conn.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence(:table, 'id'), (SELECT MAX(id) FROM {table}))"
+                ), {'table': table})
+
+    with app_module.app.app_context():
+        app_module.reconcile_counters()
+    return total_comments
+
+
+# --- Instrumentation ---
+def install_query_counter(app_module):
+    """Adds an X-Query-Count header with the number of SQL statements each request ran."""
+    from flask import g
+
+    # The metrics middleware already counts the statements of each request in g.query_count.
+    @app_module.app.after_request
+    def add_query_count(response):
+        response.headers['X-Query-Count'] = str(g.get('query_count', 0))
+        return response
+
+
+def start_server(app_module):
+    from werkzeug.serving import make_server, WSGIRequestHandler
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass # Access logging would dominate the timings
+
+    server = make_server('127.0.0.1', 0, app_module.app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# --- Load generation ---
+def sample_id_card():
+    """A real JPEG when Pillow is installed, so thumbnail generation is part of the measured load."""
+    try:
+        import io
+        from PIL import Image
+    except ImportError:
+        return os.urandom(64 * 1024)
+    buffer = io.BytesIO()
+    Image.effect_noise((1200, 800), 64).convert('RGB').save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
+
+ID_CARD = sample_id_card()
+
+
+def build_request(scenario, counts, total_comments, rng):
+    """Returns (method, path, body bytes, headers) for one request of `scenario`."""
+    if scenario == 'get_posts':
+        return 'GET', '/posts?limit=20', None, {}
+    if scenario == 'get_comments':
+        return 'GET', f"/posts/{rng.randint(1, counts['posts'])}/comments?user_id={rng.randint(1, counts['users'])}", None, {}
+    if scenario == 'toggle_like_comment':
+        body = json.dumps({'user_id': rng.randint(1, counts['users'])}).encode()
+        return 'POST', f'/comments/{rng.randint(1, total_comments)}/like', body, {'Content-Type': 'application/json'}
+    if scenario == 'login':
+        body = json.dumps({'email': f"user{rng.randint(1, counts['users'])}@bench.test", 'password': BENCH_PASSWORD}).encode()
+        return 'POST', '/login', body, {'Content-Type': 'application/json'}
+    if scenario == 'register_lawyer':
+        token = uuid.uuid4().hex
+        boundary = uuid.uuid4().hex
+        fields = {'fullName': 'Bench Lawyer', 'email': f'{token}@bench.test', 'barEnrollmentNumber': token,
+                  'cityOfPractice': 'Delhi', 'stateOfPractice': 'Delhi', 'enrollmentYear': '2015'}
+        parts = [f'--{boundary}\r\nContent-Disposition: form-data; name="{k}"\r\n\r\n{v}\r\n'.encode() for k, v in fields.items()]
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="barIdCard"; filename="id.jpeg"\r\n'
+                     f'Content-Type: image/jpeg\r\n\r\n'.encode() + ID_CARD + b'\r\n')
+        parts.append(f'--{boundary}--\r\n'.encode())
+        return 'POST', '/lawyers/register', b''.join(parts), {'Content-Type': f'multipart/form-data; boundary={boundary}'}
+    raise ValueError(scenario)
+
+
+def run_scenario(port, scenario, counts, total_comments, n_requests, concurrency, seed_value):
+    local = threading.local()
+    rng_lock = threading.Lock()
+    rng = random.Random(seed_value)
+
+    def one_request(_):
+        with rng_lock:
+            method, path, body, headers = build_request(scenario, counts, total_comments, rng)
+        conn = getattr(local, 'conn', None)
+        if conn is None:
+            conn = local.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        started = time.perf_counter()
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            payload = response.read()
+            elapsed = time.perf_counter() - started
+            return elapsed, response.status, int(response.getheader('X-Query-Count', 0)), len(payload)
+        except Exception:
+            local.conn = None
+            return time.perf_counter() - started, 0, 0, 0
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(one_request, range(n_requests)))
+    wall_time = time.perf_counter() - started
+
+    latencies = sorted(s[0] for s in samples)
+    def percentile(p):
+        return round(latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000, 2)
+    return {
+        'requests': n_requests,
+        'concurrency': concurrency,
+        'errors': sum(1 for s in samples if not 200 <= s[1] < 300),
+        'p50_ms': percentile(50),
+        'p95_ms': percentile(95),
+        'p99_ms': percentile(99),
+        'throughput_rps': round(n_requests / wall_time, 1),
+        'queries_per_request': round(sum(s[2] for s in samples) / n_requests, 2),
+        'bytes_per_response': round(sum(s[3] for s in samples) / n_requests),
+    }
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} ({baseline.get('commit', '?')}):")
+    for scenario, current in results['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(scenario)
+        if not previous:
+            continue
+        deltas = []
+        for key in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps', 'queries_per_request'):
+            if previous[key]:
+                deltas.append(f"{key} {(current[key] - previous[key]) / previous[key] * 100:+.1f}%")
+        print(f"  {scenario:22} " + ', '.join(deltas))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed a database and benchmark the API.')
+    parser.add_argument('--scale', default='1k', help=f"Number of posts: one of {', '.join(SCALES)} or an integer")
+    parser.add_argument('--database-url', help='Defaults to a fresh SQLite file in a temp directory')
+    parser.add_argument('--max-depth', type=int, default=6, help='Deepest reply nesting to generate')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=500, help='Requests per scenario')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--cache', action='store_true', help='Keep the response cache on (off by default)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='bench.json')
+    parser.add_argument('--compare', help='Earlier results file to compare against')
+    args = parser.parse_args()
+
+    posts = SCALES.get(args.scale) or int(args.scale)
+    counts = seed_counts(posts)
+    workdir = tempfile.mkdtemp(prefix='kyr-bench-')
+    output_path = os.path.abspath(args.output)
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+
+    # The app reads its configuration at import time, so set it up before importing.
+    os.environ['DATABASE_URL'] = args.database_url or f'sqlite:///{os.path.join(workdir, "bench.db")}'
+    os.chdir(workdir) # Uploads land in the temp directory
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as app_module
+
+    app_module.mail_dispatcher.submit = lambda *a, **kw: 'benchmark' # No real email
+    app_module.rate_limiter.enabled = False # Every client shares 127.0.0.1
+    if not args.cache:
+        app_module.response_cache.backend.ttl = 0 # Every read goes to the database
+    install_query_counter(app_module)
+
+    print(f"Seeding {counts} ...")
+    started = time.perf_counter()
+    total_comments = seed(app_module, counts, args.max_depth, random.Random(args.seed))
+    print(f"Seeded in {time.perf_counter() - started:.1f}s")
+
+    with app_module.app.app_context():
+        dialect = app_module.db.engine.dialect.name
+    server = start_server(app_module)
+    results = {
+        'commit': subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                 cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'database': dialect,
+        'counts': counts,
+        'cache': args.cache,
+        'scenarios': {}
+    }
+    for scenario in args.scenarios.split(','):
+        stats = run_scenario(server.server_port, scenario, counts, total_comments,
+                             args.requests, args.concurrency, args.seed)
+        results['scenarios'][scenario] = stats
+        print(f"{scenario:22} p50 {stats['p50_ms']:8.2f}ms  p95 {stats['p95_ms']:8.2f}ms  "
+              f"p99 {stats['p99_ms']:8.2f}ms  {stats['throughput_rps']:8.1f} req/s  "
+              f"{stats['queries_per_request']:5.2f} q/req  {stats['errors']} errors")
+    server.shutdown()
+
+    with open(output_path, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output_path}")
+    if compare_path:
+        compare(results, compare_path)
+
+
+if __name__ == '__main__':
+    main()
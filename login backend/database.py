@@ -0,0 +1,160 @@
+# Database setup: engine options, SQLite pragmas and versioned schema migrations.
+#
+# SQLite defaults are tuned for safety on a single writer: rollback-journal mode makes readers
+# wait behind writers and a locked database fails immediately. configure_sqlite() switches every
+# connection to WAL (readers and a writer proceed concurrently), synchronous=NORMAL (safe with
+# WAL, far fewer fsyncs), a busy timeout and larger page cache / mmap. For Postgres,
+# engine_options() sizes and recycles the connection pool.
+#
+# Schema changes after the initial release are listed in MIGRATIONS and applied in order by
+# `flask --app app migrate` (and again, as a no-op once current, when each worker starts). The
+# applied version is stored in the schema_version table. A brand-new database is created from
+# the models directly and stamped with the latest version.
+#
+# Several workers may start at once, so migrate() runs inside migration_lock(): one exclusive
+# transaction (BEGIN IMMEDIATE on SQLite, an advisory lock on Postgres). A worker that waited
+# for the lock re-reads the schema version and finds nothing left to do.
+
+import os
+from contextlib import contextmanager
+
+from sqlalchemy import event, inspect, text
+
+MIGRATION_LOCK_ID = 0x6b7972 # Postgres advisory lock key ("kyr")
+MIGRATION_LOCK_TIMEOUT_SECONDS = int(os.getenv('MIGRATION_LOCK_TIMEOUT_SECONDS', 600))
+
+
+def engine_options(database_url):
+    """SQLALCHEMY_ENGINE_OPTIONS for the given database URL."""
+    if database_url.startswith('sqlite'):
+        # check_same_thread=False: connections are pooled and reused across request threads.
+        return {'connect_args': {'timeout': float(os.getenv('SQLITE_BUSY_TIMEOUT_SECONDS', 5)), 'check_same_thread': False}}
+    return {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': True,
+    }
+
+
+def configure_sqlite(engine):
+    """Applies the performance pragmas to every new SQLite connection."""
+    if engine.dialect.name != 'sqlite':
+        return
+    pragmas = [
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',
+        f"PRAGMA busy_timeout={int(float(os.getenv('SQLITE_BUSY_TIMEOUT_SECONDS', 5)) * 1000)}",
+        f"PRAGMA cache_size=-{int(os.getenv('SQLITE_CACHE_KB', 20000))}",  # Negative = KiB
+        f"PRAGMA mmap_size={int(os.getenv('SQLITE_MMAP_BYTES', 256 * 1024 * 1024))}",
+        'PRAGMA temp_store=MEMORY',
+    ]
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+
+# --- Migration helpers (safe to re-run) ---
+def add_column(conn, table, column, ddl):
+    if column not in {c['name'] for c in inspect(conn).get_columns(table)}:
+        conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+
+def create_index(conn, name, table, columns):
+    conn.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({", ".join(columns)})'))
+
+
+# --- Migrations ---
+def add_counter_columns(conn):
+    add_column(conn, 'post', 'comment_count', 'INTEGER NOT NULL DEFAULT 0')
+    add_column(conn, 'comment', 'like_count', 'INTEGER NOT NULL DEFAULT 0')
+    conn.execute(text('UPDATE post SET comment_count = (SELECT COUNT(*) FROM comment WHERE comment.post_id = post.id)'))
+    conn.execute(text('UPDATE comment SET like_count = (SELECT COUNT(*) FROM comment_likes WHERE comment_likes.comment_id = comment.id)'))
+
+def add_lawyer_document_digests(conn):
+    for column in ('profile_picture_digest', 'bar_id_card_digest', 'enrollment_certificate_digest', 'govt_id_digest'):
+        add_column(conn, 'lawyer', column, 'VARCHAR(64)')
+
+def add_lawyer_directory_indexes(conn):
+    create_index(conn, 'ix_lawyer_status_registration', 'lawyer', ['status', 'registration_date', 'id'])
+    create_index(conn, 'ix_lawyer_status_location', 'lawyer', ['status', 'state_of_practice', 'city_of_practice'])
+    create_index(conn, 'ix_lawyer_enrollment_year', 'lawyer', ['enrollment_year'])
+
+def add_forum_indexes(conn):
+    create_index(conn, 'ix_post_timestamp_id', 'post', ['timestamp', 'id'])
+    create_index(conn, 'ix_post_user_id', 'post', ['user_id'])
+    create_index(conn, 'ix_comment_post_id_timestamp', 'comment', ['post_id', 'timestamp', 'id'])
+    create_index(conn, 'ix_comment_parent_id', 'comment', ['parent_id'])
+    create_index(conn, 'ix_comment_likes_comment_id', 'comment_likes', ['comment_id'])
+
+def add_comment_tombstones(conn):
+    add_column(conn, 'comment', 'is_deleted', 'BOOLEAN NOT NULL DEFAULT FALSE')
+
+def add_lawyer_email_lower_index(conn):
+    create_index(conn, 'ix_lawyer_email_lower', 'lawyer', ['lower(email)'])
+
+# (version, description, function). Append only; never renumber or edit an applied migration.
+MIGRATIONS = [
+    (1, 'Denormalized post/comment counters', add_counter_columns),
+    (2, 'SHA-256 digests of lawyer documents', add_lawyer_document_digests),
+    (3, 'Lawyer directory indexes', add_lawyer_directory_indexes),
+    (4, 'Forum feed and thread indexes', add_forum_indexes),
+    (5, 'Soft-deleted comment tombstones', add_comment_tombstones),
+    (6, 'Case-insensitive lawyer email lookup', add_lawyer_email_lower_index),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn):
+    return conn.execute(text('SELECT MAX(version) FROM schema_version')).scalar() or 0
+
+@contextmanager
+def migration_lock(engine):
+    """Yields a connection in a transaction that no other process can enter until it commits."""
+    if engine.dialect.name != 'sqlite':
+        with engine.begin() as conn:
+            if engine.dialect.name == 'postgresql':
+                conn.execute(text('SELECT pg_advisory_xact_lock(:id)'), {'id': MIGRATION_LOCK_ID})
+            yield conn
+        return
+    # pysqlite would only BEGIN (deferred) before DML; take the write lock up front instead, and
+    # wait for it longer than the usual busy timeout since another worker may be migrating.
+    with engine.connect() as conn:
+        conn = conn.execution_options(isolation_level='AUTOCOMMIT')
+        busy_timeout = conn.exec_driver_sql('PRAGMA busy_timeout').scalar()
+        conn.exec_driver_sql(f'PRAGMA busy_timeout={MIGRATION_LOCK_TIMEOUT_SECONDS * 1000}')
+        try:
+            conn.exec_driver_sql('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.exec_driver_sql('ROLLBACK')
+                raise
+            conn.exec_driver_sql('COMMIT')
+        finally:
+            conn.exec_driver_sql(f'PRAGMA busy_timeout={busy_timeout}')
+
+def migrate(conn, metadata):
+    """Brings the database schema up to LATEST_VERSION. `conn` should come from migration_lock()."""
+    tables = set(inspect(conn).get_table_names())
+    conn.execute(text('CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, description VARCHAR(200))'))
+    if 'user' not in tables:
+        # Fresh database: the models already describe the latest schema.
+        metadata.create_all(conn)
+        conn.execute(text('INSERT INTO schema_version (version, description) VALUES (:v, :d)'),
+                     {'v': LATEST_VERSION, 'd': 'Initial schema'})
+        return
+    metadata.create_all(conn) # Tables introduced after the initial release
+    current = get_schema_version(conn)
+
+    for version, description, apply in MIGRATIONS:
+        if version <= current:
+            continue
+        apply(conn)
+        conn.execute(text('INSERT INTO schema_version (version, description) VALUES (:v, :d)'),
+                     {'v': version, 'd': description})
+        print(f'✅ Applied migration {version}: {description}')
@@ -0,0 +1,95 @@
+# Publish/subscribe bus behind the /stream Server-Sent Events endpoint.
+#
+# Write routes publish small deltas ("comment 42 now has 7 likes") to a topic: 'posts' for the
+# forum feed and 'post:<id>' for one thread. Each open /stream connection holds a Subscription
+# with a bounded queue for the topics it asked for. A client that falls too far behind is sent
+# a 'resync' event and disconnected; it should refetch and reconnect.
+#
+# LocalEventBus only reaches clients connected to the same worker process. RedisEventBus
+# publishes through a Redis channel, and every worker relays what it receives to its own local
+# subscribers, so events reach clients connected to any worker.
+
+import json
+import queue
+import itertools
+import threading
+
+
+class Subscription:
+    def __init__(self, bus, topics, max_queued):
+        self.bus = bus
+        self.topics = set(topics)
+        self.overflowed = False
+        self._queue = queue.Queue(maxsize=max_queued)
+
+    def offer(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout):
+        """Next event, or None if nothing arrived within `timeout` seconds."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+class LocalEventBus:
+    def __init__(self, max_queued=100):
+        self.max_queued = max_queued
+        self._subscriptions = set()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def subscribe(self, topics):
+        subscription = Subscription(self, topics, self.max_queued)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, topic, event_type, data):
+        self.deliver({'id': next(self._ids), 'topic': topic, 'type': event_type, 'data': data})
+
+    def deliver(self, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            if event['topic'] in subscription.topics:
+                subscription.offer(event)
+
+
+class RedisEventBus(LocalEventBus):
+    def __init__(self, url, channel='kyr:events', max_queued=100):
+        import redis  # Optional dependency, only needed when EVENT_BUS_REDIS_URL is set
+        super().__init__(max_queued)
+        self.client = redis.Redis.from_url(url)
+        self.channel = channel
+        self._listener = threading.Thread(target=self._listen, name='event-bus', daemon=True)
+        self._listener.start()
+
+    def publish(self, topic, event_type, data):
+        # Delivered locally by _listen() like every other worker's events
+        self.client.publish(self.channel, json.dumps({'topic': topic, 'type': event_type, 'data': data}))
+
+    def _listen(self):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel)
+        for message in pubsub.listen():
+            event = json.loads(message['data'])
+            event['id'] = next(self._ids)
+            self.deliver(event)
+
+
+def make_event_bus(redis_url=None, max_queued=100):
+    if redis_url:
+        return RedisEventBus(redis_url, max_queued=max_queued)
+    return LocalEventBus(max_queued=max_queued)
@@ -0,0 +1,211 @@
+# Bulk import and export of the lawyer directory as CSV or JSONL.
+#
+# Imports read the input row by row and insert in batches: each batch is validated, checked for
+# existing emails / bar enrollment numbers with a single query, written with
+# bulk_insert_mappings() and committed. Problems are reported per input row (line number and
+# reason) instead of failing the whole file.
+#
+# Emails are stored as given but matched case-insensitively, like /lawyers/register users would
+# expect ("Asha@X" and "asha@x" are the same lawyer). Imported lawyers start as 'pending' so they
+# still go through admin review; keep_status=True (the CLI's --keep-status) keeps the file's
+# status column instead.
+#
+# Exports walk the table in id order one batch at a time and yield text as they go, so memory
+# use does not grow with the size of the directory.
+#
+# Imported lawyers have no uploaded documents, so bar_id_card_path (required) defaults to ''.
+
+import io
+import csv
+import json
+from datetime import datetime, timezone
+
+from sqlalchemy import select, or_, func
+from sqlalchemy.exc import IntegrityError
+
+FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+# Columns an import may set; everything else is ignored
+IMPORT_FIELDS = [
+    'full_name', 'email', 'contact_number', 'bar_enrollment_number', 'state_bar_council',
+    'enrollment_year', 'city_of_practice', 'state_of_practice', 'bio', 'status'
+]
+REQUIRED_FIELDS = ['full_name', 'email', 'bar_enrollment_number']
+STATUSES = {'pending', 'approved', 'rejected'}
+MAX_REPORTED_ERRORS = 1000
+
+
+def format_from_content_type(content_type):
+    for fmt, mimetype in FORMATS.items():
+        if content_type and content_type.startswith(mimetype):
+            return fmt
+    return None
+
+
+# --- Import ---
+def read_rows(text_stream, fmt):
+    """Yields (line number, row dict or None, parse error or None) from a CSV or JSONL stream."""
+    if fmt == 'csv':
+        reader = csv.DictReader(text_stream)
+        for row in reader:
+            yield reader.line_num, row, None
+        return
+    for line_number, line in enumerate(text_stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_number, None, f'Invalid JSON: {e}'
+            continue
+        if isinstance(row, dict):
+            yield line_number, row, None
+        else:
+            yield line_number, None, 'Expected a JSON object.'
+
+
+def clean_row(row, keep_status=False):
+    """Returns (mapping for bulk_insert_mappings, None) or (None, error message)."""
+    mapping = {}
+    for field in IMPORT_FIELDS:
+        value = row.get(field)
+        if isinstance(value, str):
+            value = value.strip() or None
+        mapping[field] = value
+    missing = [f for f in REQUIRED_FIELDS if not mapping[f]]
+    if missing:
+        return None, f"Missing {', '.join(missing)}."
+    mapping['email'] = str(mapping['email'])
+    mapping['bar_enrollment_number'] = str(mapping['bar_enrollment_number'])
+    if mapping['enrollment_year'] is not None:
+        try:
+            mapping['enrollment_year'] = int(mapping['enrollment_year'])
+        except (TypeError, ValueError):
+            return None, 'enrollment_year must be a number.'
+    mapping['status'] = (mapping['status'] if keep_status else None) or 'pending'
+    if mapping['status'] not in STATUSES:
+        return None, f"status must be one of {', '.join(sorted(STATUSES))}."
+    mapping['bar_id_card_path'] = ''
+    mapping['registration_date'] = datetime.now(timezone.utc)
+    return mapping, None
+
+
+class ImportReport:
+    def __init__(self):
+        self.inserted = 0
+        self.duplicates = 0
+        self.failed = 0
+        self.errors = []  # Capped at MAX_REPORTED_ERRORS; the counts are always complete
+
+    def error(self, line_number, message, duplicate=False):
+        if duplicate:
+            self.duplicates += 1
+        else:
+            self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line_number, 'error': message})
+
+    def to_dict(self):
+        return {
+            'inserted': self.inserted,
+            'duplicates': self.duplicates,
+            'failed': self.failed,
+            'errors': sorted(self.errors, key=lambda e: e['line']),
+            'errors_truncated': self.duplicates + self.failed > len(self.errors)
+        }
+
+
+def import_lawyers(session, model, rows, batch_size=1000, keep_status=False):
+    """Inserts the rows from read_rows() in batches and returns an ImportReport."""
+    report = ImportReport()
+    batch = []
+    for line_number, row, parse_error in rows:
+        if parse_error:
+            report.error(line_number, parse_error)
+            continue
+        mapping, error = clean_row(row, keep_status)
+        if error:
+            report.error(line_number, error)
+            continue
+        batch.append((line_number, mapping))
+        if len(batch) >= batch_size:
+            _insert_batch(session, model, batch, report)
+            batch = []
+    if batch:
+        _insert_batch(session, model, batch, report)
+    return report
+
+
+def _insert_batch(session, model, batch, report):
+    emails = {m['email'].lower() for _, m in batch}
+    enrollment_numbers = {m['bar_enrollment_number'] for _, m in batch}
+    # One lookup for the whole batch (ix_lawyer_email_lower covers the lower(email) match)
+    existing = session.execute(
+        select(model.email, model.bar_enrollment_number)
+        .where(or_(func.lower(model.email).in_(emails), model.bar_enrollment_number.in_(enrollment_numbers)))
+    ).all()
+    taken_emails = {row.email.lower() for row in existing}
+    taken_numbers = {row.bar_enrollment_number for row in existing}
+
+    to_insert = []
+    for line_number, mapping in batch:
+        if mapping['email'].lower() in taken_emails:
+            report.error(line_number, f"Email {mapping['email']} is already registered.", duplicate=True)
+        elif mapping['bar_enrollment_number'] in taken_numbers:
+            report.error(line_number, f"Bar enrollment number {mapping['bar_enrollment_number']} is already registered.", duplicate=True)
+        else:
+            # Later rows of the same file are checked against this one too
+            taken_emails.add(mapping['email'].lower())
+            taken_numbers.add(mapping['bar_enrollment_number'])
+            to_insert.append((line_number, mapping))
+
+    if not to_insert:
+        return
+    try:
+        session.bulk_insert_mappings(model, [m for _, m in to_insert])
+        session.commit()
+        report.inserted += len(to_insert)
+    except IntegrityError:
+        # Someone registered one of these lawyers since the lookup; find which rows, one at a time.
+        session.rollback()
+        for line_number, mapping in to_insert:
+            try:
+                session.bulk_insert_mappings(model, [mapping])
+                session.commit()
+                report.inserted += 1
+            except IntegrityError:
+                session.rollback()
+                report.error(line_number, 'Email or bar enrollment number is already registered.', duplicate=True)
+
+
+# --- Export ---
+def export_lawyers(session, model, fields, fmt, status=None, batch_size=1000):
+    """Yields the lawyer directory as CSV or JSONL text, one batch of rows per chunk."""
+    columns = [getattr(model, f) for f in fields]
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+        yield buffer.getvalue()
+
+    last_id = 0
+    while True:
+        query = select(model.id, *columns).where(model.id > last_id).order_by(model.id).limit(batch_size)
+        if status:
+            query = query.where(model.status == status)
+        rows = session.execute(query).all()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+
+        buffer = io.StringIO()
+        if fmt == 'csv':
+            writer = csv.writer(buffer)
+            for row in rows:
+                writer.writerow([v.isoformat() if isinstance(v, datetime) else v for v in row[1:]])
+        else:
+            for row in rows:
+                record = {f: v.isoformat() if isinstance(v, datetime) else v for f, v in zip(fields, row[1:])}
+                buffer.write(json.dumps(record) + '\n')
+        # Release the connection between batches instead of holding it for the whole download.
+        session.commit()
+        yield buffer.getvalue()
@@ -0,0 +1,113 @@
+# Background dispatcher for outbound email (OTP codes).
+#
+# Request handlers call submit() and return straight away; a small pool of worker threads
+# does the SMTP work. Each worker keeps its SMTP connection open between messages instead of
+# doing a fresh connect + STARTTLS + login per email. Failed sends are retried with exponential
+# backoff, and the state of every job can be polled with status(job_id).
+#
+# Job states live in `job_store`, any of the otp_store backends. With the 'database' or 'redis'
+# backend a job queued by one worker can be polled on any other; the default in-memory store
+# only knows the jobs of its own process.
+#
+# Any SMTP server works for local testing, e.g.: python -m aiosmtpd -n -l localhost:1025
+
+import time
+import uuid
+import smtplib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+
+from otp_store import MemoryOTPStore
+
+
+class MailDispatcher:
+    def __init__(self, server, port, username=None, password=None, use_tls=True,
+                 workers=2, max_retries=3, backoff_seconds=1.0, timeout=30, max_tracked_jobs=10000,
+                 job_store=None, job_ttl=3600):
+        self.server = server
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.timeout = timeout
+        self.max_tracked_jobs = max_tracked_jobs
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='mail')
+        self._local = threading.local()  # One SMTP connection per worker thread
+        self.job_store = job_store or MemoryOTPStore(ttl=job_ttl, max_entries=max_tracked_jobs)
+
+    # --- Public API ---
+    def submit(self, recipient, subject, body, on_failure=None):
+        """Queues an email and returns its job id. on_failure() runs if every attempt fails."""
+        msg = EmailMessage()
+        msg['Subject'] = subject
+        msg['From'] = self.username
+        msg['To'] = recipient
+        msg.set_content(body)
+
+        job_id = uuid.uuid4().hex
+        self._set_status(job_id, 'queued', attempts=0)
+        self._executor.submit(self._deliver, job_id, msg, on_failure)
+        return job_id
+
+    def status(self, job_id):
+        return self.job_store.get(job_id)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    # --- Worker side ---
+    def _deliver(self, job_id, msg, on_failure):
+        for attempt in range(1, self.max_retries + 1):
+            self._set_status(job_id, 'sending', attempts=attempt)
+            try:
+                self._send(msg)
+                self._set_status(job_id, 'sent', attempts=attempt)
+                return
+            except Exception as e:
+                self._drop_connection()
+                print(f"❌ Failed to send email to {msg['To']} (attempt {attempt}): {e}")
+                if attempt < self.max_retries:
+                    self._set_status(job_id, 'retrying', attempts=attempt)
+                    time.sleep(self.backoff_seconds * 2 ** (attempt - 1))
+        self._set_status(job_id, 'failed', attempts=self.max_retries)
+        if on_failure:
+            on_failure()
+
+    def _send(self, msg):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            try:
+                conn.send_message(msg)
+                return
+            except smtplib.SMTPServerDisconnected:
+                # The server closed the idle connection; reconnect and send once more.
+                self._drop_connection()
+        self._connect().send_message(msg)
+
+    def _connect(self):
+        conn = smtplib.SMTP(self.server, self.port, timeout=self.timeout)
+        if self.use_tls:
+            conn.starttls()
+        if self.username and self.password:
+            conn.login(self.username, self.password)
+        self._local.conn = conn
+        return conn
+
+    def _drop_connection(self):
+        conn = getattr(self._local, 'conn', None)
+        self._local.conn = None
+        if conn is not None:
+            try:
+                conn.quit()
+            except Exception:
+                pass
+
+    def _set_status(self, job_id, state, attempts):
+        try:
+            self.job_store.put(job_id, {'status': state, 'attempts': attempts})
+        except Exception as e:
+            # A status that cannot be saved must not stop the email from going out.
+            print(f"❌ Could not save the status of mail job {job_id}: {e}")
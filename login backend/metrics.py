@@ -0,0 +1,245 @@
+# Per-request metrics, slow-query log and opt-in sampling profiler.
+#
+# RequestMetrics hooks into Flask (before/after request) and SQLAlchemy (cursor execute events)
+# and records, per route: latency, response size, number of SQL statements and time spent in
+# the database. render() returns everything in the Prometheus text format for /metrics.
+#
+# Requests that run more than `max_queries` statements are logged with the stack of the
+# statement that crossed the limit (usually the loop causing an N+1), and any single statement
+# slower than `slow_query_seconds` is logged with its own stack.
+#
+# With `profiling` enabled, adding ?__profile=1 to a request samples its thread's stack every
+# few milliseconds and writes the result in collapsed-stack format (one "frame;frame;frame count"
+# line per stack), which flamegraph.pl and speedscope read directly.
+#
+# Metrics live in the worker process; with several workers each one reports its own numbers.
+# The N+1 and slow-query reports are WARNING records on the 'metrics' logger, so they can be
+# routed or filtered like any other log output.
+
+import os
+import sys
+import logging
+import time
+import threading
+import traceback
+from collections import Counter
+from datetime import datetime
+
+from flask import g, request, has_request_context
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+# --- Metric types ---
+def format_labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.setdefault(label_values, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            snapshot = {k: list(v) for k, v in self._series.items()}
+        for label_values, series in sorted(snapshot.items()):
+            for bound, count in zip(self.buckets, series):
+                labels = format_labels(self.labels + ['le'], list(label_values) + [bound])
+                lines.append(f'{self.name}_bucket{labels} {count}')
+            labels = format_labels(self.labels + ['le'], list(label_values) + ['+Inf'])
+            lines.append(f'{self.name}_bucket{labels} {series[-1]}')
+            labels = format_labels(self.labels, label_values)
+            lines.append(f'{self.name}_sum{labels} {series[-2]}')
+            lines.append(f'{self.name}_count{labels} {series[-1]}')
+        return lines
+
+
+class CounterMetric:
+    def __init__(self, name, help_text, labels):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = Counter()
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] += amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            snapshot = dict(self._values)
+        for label_values, value in sorted(snapshot.items()):
+            lines.append(f'{self.name}{format_labels(self.labels, label_values)} {value}')
+        return lines
+
+
+# --- Sampling profiler ---
+class StackSampler:
+    """Samples one thread's stack on a background thread until stop() is called."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(names))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        return self.stacks
+
+
+# --- Middleware ---
+class RequestMetrics:
+    def __init__(self, app, engine, max_queries=20, slow_query_seconds=0.25,
+                 profiling=False, profile_dir='profiles', profile_interval=0.005):
+        self.max_queries = max_queries
+        self.slow_query_seconds = slow_query_seconds
+        self.profiling = profiling
+        self.profile_dir = profile_dir
+        self.profile_interval = profile_interval
+        self.app_root = app.root_path
+
+        self.request_latency = Histogram(
+            'http_request_duration_seconds', 'Time spent handling the request.',
+            ['method', 'route', 'status'], LATENCY_BUCKETS)
+        self.response_bytes = Histogram(
+            'http_response_size_bytes', 'Size of the response body.', ['route'], BYTES_BUCKETS)
+        self.query_count = Histogram(
+            'db_queries_per_request', 'SQL statements executed per request.', ['route'], QUERY_COUNT_BUCKETS)
+        self.db_time = Histogram(
+            'db_time_per_request_seconds', 'Time spent in SQL statements per request.', ['route'], LATENCY_BUCKETS)
+        self.password_hash_time = Histogram(
+            'password_hash_duration_seconds', 'Time taken to hash or verify a password.',
+            ['operation'], LATENCY_BUCKETS)
+        self.slow_events = CounterMetric(
+            'slow_request_events_total', 'Requests over the query limit and statements over the time limit.',
+            ['route', 'kind'])
+        self._metrics = [self.request_latency, self.response_bytes, self.query_count, self.db_time,
+                         self.password_hash_time, self.slow_events]
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def observe_password_hash(self, operation, seconds):
+        self.password_hash_time.observe(seconds, operation)
+
+    def _route(self):
+        # The URL rule, not the path, so /posts/1 and /posts/2 share one series.
+        return request.url_rule.rule if request.url_rule else '<unmatched>'
+
+    def _app_stack(self):
+        """The current stack, trimmed to frames from the app's own files."""
+        frames = [f for f in traceback.extract_stack()[:-2]
+                  if f.filename.startswith(self.app_root) and 'site-packages' not in f.filename]
+        return ''.join(traceback.format_list(frames))
+
+    # --- Flask hooks ---
+    def _before_request(self):
+        g.metrics_started = time.perf_counter()
+        g.query_count = 0
+        g.db_time = 0.0
+        g.query_limit_stack = None
+        if self.profiling and request.args.get('__profile') == '1':
+            g.profiler = StackSampler(threading.get_ident(), self.profile_interval)
+
+    def _after_request(self, response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        route = self._route()
+        self.request_latency.observe(elapsed, request.method, route, response.status_code)
+        self.query_count.observe(g.query_count, route)
+        self.db_time.observe(g.db_time, route)
+        # Streamed responses (files, /stream) have no length until they have been sent.
+        if response.content_length is not None:
+            self.response_bytes.observe(response.content_length, route)
+
+        if g.query_limit_stack is not None:
+            self.slow_events.inc(route, 'too_many_queries')
+            logger.warning("%s %s ran %d queries (limit %d). Statement #%d came from:\n%s",
+                           request.method, request.full_path.rstrip('?'), g.query_count, self.max_queries,
+                           self.max_queries + 1, g.query_limit_stack)
+
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            response.headers['X-Profile-Output'] = self._write_profile(profiler.stop(), route)
+        return response
+
+    def _write_profile(self, stacks, route):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        slug = ''.join(c if c.isalnum() else '_' for c in f'{request.method}{route}').strip('_')
+        path = os.path.join(self.profile_dir, f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{slug}.folded")
+        with open(path, 'w') as f:
+            for stack, count in stacks.most_common():
+                f.write(f'{stack} {count}\n')
+        return os.path.basename(path)
+
+    # --- SQLAlchemy hooks ---
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['metrics_query_start'].pop()
+        # Statements from background threads (mail, OTP sweeper) have no request to attribute to.
+        if not has_request_context() or 'metrics_started' not in g:
+            return
+        g.query_count += 1
+        g.db_time += elapsed
+        if g.query_count == self.max_queries + 1:
+            g.query_limit_stack = self._app_stack()
+        if elapsed > self.slow_query_seconds:
+            self.slow_events.inc(self._route(), 'slow_query')
+            logger.warning("Slow query (%.0f ms) in %s %s:\n%s\n%s", elapsed * 1000, request.method,
+                           request.full_path.rstrip('?'), statement, self._app_stack())
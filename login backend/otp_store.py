@@ -0,0 +1,155 @@
+# Storage for pending registrations (name, password hash, OTP) between /register and /verify-email.
+#
+# Three backends share one interface: put(email, record), get(email), pop(email), sweep().
+#   - MemoryOTPStore:   a dict guarded by a lock. Only correct with a single worker process.
+#   - DatabaseOTPStore: a table in the app database, so every worker (and host) sees the same OTPs.
+#   - RedisOTPStore:    keys with a native TTL, for deployments that already run Redis.
+# get() never returns an expired record. Expired records are also removed in the background
+# by start_sweeper(), so abandoned registrations do not pile up.
+#
+# The same backends hold the status of OTP mail jobs (see mail_queue.py), in their own table or
+# key prefix, so /register/mail-status answers on every worker.
+
+import json
+import time
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import Table, Column, String, Text, Float, MetaData, select, delete, func
+
+
+class MemoryOTPStore:
+    def __init__(self, ttl, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._records = OrderedDict()  # Insertion order == age, oldest first
+        self._lock = threading.Lock()
+
+    def put(self, email, record):
+        with self._lock:
+            self._records.pop(email, None)
+            self._records[email] = (time.time(), record)
+            while len(self._records) > self.max_entries:
+                self._records.popitem(last=False)
+
+    def get(self, email):
+        with self._lock:
+            item = self._records.get(email)
+            if item is None:
+                return None
+            created_at, record = item
+            if time.time() - created_at > self.ttl:
+                del self._records[email]
+                return None
+            return record
+
+    def pop(self, email):
+        with self._lock:
+            item = self._records.pop(email, None)
+            return item[1] if item else None
+
+    def sweep(self):
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            while self._records:
+                email, (created_at, _) = next(iter(self._records.items()))
+                if created_at > cutoff:
+                    break
+                del self._records[email]
+
+
+metadata = MetaData()
+otp_pending = Table('otp_pending', metadata,
+    Column('email', String(150), primary_key=True),
+    Column('payload', Text, nullable=False),
+    Column('created_at', Float, nullable=False, index=True)
+)
+mail_job_status = Table('mail_job_status', metadata,
+    Column('job_id', String(64), primary_key=True),
+    Column('payload', Text, nullable=False),
+    Column('created_at', Float, nullable=False, index=True)
+)
+
+
+class DatabaseOTPStore:
+    def __init__(self, engine, ttl, max_entries=10000, table=otp_pending):
+        self.engine = engine
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.table = table
+        self.key = table.primary_key.columns.values()[0]
+        metadata.create_all(engine)
+
+    def put(self, email, record):
+        table = self.table
+        with self.engine.begin() as conn:
+            conn.execute(delete(table).where(self.key == email))
+            conn.execute(table.insert().values({self.key.name: email, 'payload': json.dumps(record), 'created_at': time.time()}))
+            overflow = conn.execute(select(func.count()).select_from(table)).scalar() - self.max_entries
+            if overflow > 0:
+                oldest = select(self.key).order_by(table.c.created_at).limit(overflow)
+                conn.execute(delete(table).where(self.key.in_(oldest)))
+
+    def get(self, email):
+        with self.engine.connect() as conn:
+            row = conn.execute(select(self.table).where(
+                self.key == email,
+                self.table.c.created_at >= time.time() - self.ttl
+            )).first()
+        return json.loads(row.payload) if row else None
+
+    def pop(self, email):
+        with self.engine.begin() as conn:
+            row = conn.execute(select(self.table).where(self.key == email)).first()
+            conn.execute(delete(self.table).where(self.key == email))
+        return json.loads(row.payload) if row else None
+
+    def sweep(self):
+        with self.engine.begin() as conn:
+            conn.execute(delete(self.table).where(self.table.c.created_at < time.time() - self.ttl))
+
+
+class RedisOTPStore:
+    def __init__(self, url, ttl, prefix='kyr:otp:'):
+        import redis  # Optional dependency, only needed for OTP_STORE_BACKEND=redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def put(self, email, record):
+        self.client.set(self.prefix + email, json.dumps(record), ex=self.ttl)
+
+    def get(self, email):
+        raw = self.client.get(self.prefix + email)
+        return json.loads(raw) if raw else None
+
+    def pop(self, email):
+        raw = self.client.getdel(self.prefix + email)
+        return json.loads(raw) if raw else None
+
+    def sweep(self):
+        pass  # Redis expires keys on its own
+
+
+def start_sweeper(store, interval=60):
+    """Runs store.sweep() every `interval` seconds on a daemon thread."""
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                store.sweep()
+            except Exception as e:
+                print(f"❌ Sweep of {type(store).__name__} failed: {e}")
+    thread = threading.Thread(target=run, name='otp-sweeper', daemon=True)
+    thread.start()
+    return thread
+
+
+def make_otp_store(backend, ttl, max_entries=10000, engine=None, redis_url=None,
+                   table=otp_pending, redis_prefix='kyr:otp:'):
+    """Builds the store named by OTP_STORE_BACKEND ('memory', 'database' or 'redis')."""
+    if backend == 'database':
+        return DatabaseOTPStore(engine, ttl, max_entries, table=table)
+    if backend == 'redis':
+        return RedisOTPStore(redis_url, ttl, prefix=redis_prefix)
+    return MemoryOTPStore(ttl, max_entries)
@@ -0,0 +1,73 @@
+# Password hashing off the request threads.
+#
+# scrypt/pbkdf2 are meant to be slow, so running them inline lets a burst of /login calls occupy
+# every worker thread and stall the cheap forum endpoints. PasswordHasher runs them on a small,
+# bounded thread pool instead: hashlib.scrypt and pbkdf2_hmac release the GIL, so the hashes run
+# in parallel with request handling. (A process pool started at import time breaks under the
+# 'spawn' start method used on macOS and Windows.) At most `max_pending` hashes may be queued or
+# running; past that the call fails fast with PasswordHasherBusy so the route can shed load with
+# a 503.
+#
+# `observer`, if given, is called as observer(operation, seconds) after every hash/verify.
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, BrokenExecutor, TimeoutError as FutureTimeoutError
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing pool is saturated or broken, or a hash did not finish in time."""
+
+
+class PasswordHasher:
+    def __init__(self, method='scrypt', salt_length=16, workers=2, max_pending=32, timeout=10, observer=None):
+        self.method = method
+        self.salt_length = salt_length
+        self.timeout = timeout
+        self.observer = observer
+        # Hash once up front: validates the method and tells us what prefix new hashes carry
+        # (e.g. 'scrypt' is stored as 'scrypt:32768:8:1').
+        self.prefix = generate_password_hash('', method, salt_length).split('$', 1)[0]
+        # workers=0 hashes inline, which is handy for local debugging.
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash') if workers else None
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def hash(self, password):
+        return self._timed('hash', generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, pwhash, password):
+        return self._timed('verify', check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """True if the hash was made with different parameters than the configured ones."""
+        return pwhash.split('$', 1)[0] != self.prefix
+
+    def _timed(self, operation, fn, *args):
+        started = time.perf_counter()
+        result = self._run(fn, *args)
+        if self.observer:
+            self.observer(operation, time.perf_counter() - started)
+        return result
+
+    def _run(self, fn, *args):
+        if self._pool is None:
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy()
+        try:
+            future = self._pool.submit(fn, *args)
+        except (BrokenExecutor, RuntimeError):
+            # Broken or shut-down pool: shed the request with a 503 rather than a 500.
+            self._slots.release()
+            raise PasswordHasherBusy()
+        except Exception:
+            self._slots.release()
+            raise
+        # The slot is freed when the work finishes, even if we stopped waiting for it.
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except (FutureTimeoutError, BrokenExecutor):
+            raise PasswordHasherBusy()
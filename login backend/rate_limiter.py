@@ -0,0 +1,147 @@
+# Request rate limiting for the expensive auth and upload routes.
+#
+# Limits use GCRA (generic cell rate algorithm), the sliding-window equivalent of a token
+# bucket: a limit of N per period lets a client make up to N requests at once, after which one
+# more is allowed every period/N seconds. The whole state of a key is a single timestamp, the
+# "theoretical arrival time" (TAT) of its next request, and a key whose TAT is in the past is
+# back at full allowance, so it can be dropped.
+#
+# MemoryRateLimitBackend keeps the timestamps in a dict (per worker process); expired keys are
+# removed by sweep(). RedisRateLimitBackend runs the same check atomically in Redis, so every
+# worker shares one set of limits.
+#
+# Views opt in with @rate_limiter.limit(name, ip='10/minute', email='5/hour'). The check runs
+# before the view body, so a rejected request costs no database, hashing or SMTP work.
+
+import re
+import time
+import threading
+from functools import wraps
+
+from flask import request, jsonify
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+def parse_rate(rate):
+    """'10/minute' or '5/15minutes' -> (limit, period in seconds)."""
+    match = re.fullmatch(r'\s*(\d+)\s*/\s*(\d*)\s*(second|minute|hour|day)s?\s*', rate)
+    if not match:
+        raise ValueError(f'Invalid rate limit: {rate!r}')
+    count, multiplier, unit = match.groups()
+    return int(count), int(multiplier or 1) * PERIODS[unit]
+
+
+class MemoryRateLimitBackend:
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._tats = {}  # key -> TAT; insertion order is least recently used first
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit, period):
+        """Records a request. Returns 0 if it is allowed, otherwise seconds until it would be."""
+        interval = period / limit
+        now = time.time()
+        with self._lock:
+            tat = max(self._tats.pop(key, now), now)
+            wait = tat - (now + period - interval)
+            if wait > 0:
+                self._tats[key] = tat
+                return wait
+            self._tats[key] = tat + interval
+            if len(self._tats) > self.max_entries:
+                self._sweep_locked(now)
+                while len(self._tats) > self.max_entries:
+                    del self._tats[next(iter(self._tats))]
+            return 0
+
+    def sweep(self):
+        with self._lock:
+            self._sweep_locked(time.time())
+
+    def _sweep_locked(self, now):
+        for key in [k for k, tat in self._tats.items() if tat <= now]:
+            del self._tats[key]
+
+
+# KEYS[1] = key; ARGV = now, limit interval, period. Returns the wait in milliseconds (0 = allowed).
+GCRA_SCRIPT = """
+local now = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2])
+local period = tonumber(ARGV[3])
+local tat = math.max(tonumber(redis.call('GET', KEYS[1]) or now), now)
+local wait = tat - (now + period - interval)
+if wait > 0 then
+    return math.ceil(wait * 1000)
+end
+redis.call('SET', KEYS[1], tat + interval, 'PX', math.ceil((tat + interval - now) * 1000))
+return 0
+"""
+
+
+class RedisRateLimitBackend:
+    def __init__(self, url, prefix='kyr:rate:'):
+        import redis  # Optional dependency, only needed when RATE_LIMIT_REDIS_URL is set
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._script = self.client.register_script(GCRA_SCRIPT)
+
+    def hit(self, key, limit, period):
+        wait_ms = self._script(keys=[self.prefix + key], args=[time.time(), period / limit, period])
+        return wait_ms / 1000
+
+    def sweep(self):
+        pass  # Redis expires keys on its own
+
+
+def make_rate_limit_backend(redis_url=None, max_entries=100000):
+    if redis_url:
+        return RedisRateLimitBackend(redis_url)
+    return MemoryRateLimitBackend(max_entries=max_entries)
+
+
+class RateLimiter:
+    def __init__(self, backend, enabled=True):
+        self.backend = backend
+        self.enabled = enabled
+
+    def limit(self, name, ip=None, email=None):
+        """Limits a view per client IP and/or per email address in its JSON body.
+
+        `ip` and `email` are rates like '10/minute'; either may be None to skip that check.
+        """
+        rules = []
+        if ip:
+            rules.append(('ip', parse_rate(ip)))
+        if email:
+            rules.append(('email', parse_rate(email)))
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if self.enabled:
+                    for kind, (limit, period) in rules:
+                        value = self._client_value(kind)
+                        if value is None:
+                            continue
+                        wait = self.backend.hit(f'{name}:{kind}:{value}', limit, period)
+                        if wait > 0:
+                            return self._too_many_requests(wait)
+                return view(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def _client_value(kind):
+        if kind == 'ip':
+            return request.remote_addr
+        # Only JSON bodies are read here; parsing a multipart form would store its uploads.
+        data = request.get_json(silent=True) if request.is_json else None
+        email = data.get('email') if isinstance(data, dict) else None
+        return email.strip().lower() if isinstance(email, str) and email.strip() else None
+
+    @staticmethod
+    def _too_many_requests(wait):
+        response = jsonify({'success': False, 'message': 'Too many requests. Please try again later.'})
+        response.headers['Retry-After'] = str(max(1, int(wait + 0.999)))
+        return response, 429
@@ -0,0 +1,159 @@
+# Read-through cache for the JSON read endpoints (/posts, /posts/<id>/comments, /lawyers).
+#
+# Cached responses carry an ETag and Last-Modified header so clients that already hold the
+# latest copy get a 304 with no body. Entries are grouped under tags (e.g. "posts",
+# "comments:12"); the write routes call invalidate() with the tags they touched. Each tag has
+# a version number that is part of the cache key, so bumping it makes every older entry
+# unreachable without having to scan the cache.
+
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import request, current_app
+
+
+# --- Backends ---
+class LRUCache:
+    """In-process LRU with a per-entry TTL. Safe to share between threads of one worker."""
+
+    def __init__(self, max_entries=1024, ttl=60, max_tags=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_tags = max_tags or 4 * max_entries
+        self._entries = OrderedDict()
+        # Tag versions have their own LRU, so one per post ever invalidated does not pile up.
+        # Every bump takes the next value of a per-process generation counter, and a tag that was
+        # evicted comes back at the current generation. That can only equal a version its entries
+        # were stored under if nothing was invalidated since, i.e. while those entries are current.
+        self._versions = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def get_version(self, tag):
+        with self._lock:
+            version = self._versions.get(tag)
+            if version is None:
+                version = self._generation
+                self._set_version_locked(tag, version)
+            else:
+                self._versions.move_to_end(tag)
+            return version
+
+    def bump_version(self, tag):
+        with self._lock:
+            self._generation += 1
+            self._set_version_locked(tag, self._generation)
+
+    def _set_version_locked(self, tag, version):
+        self._versions[tag] = version
+        self._versions.move_to_end(tag)
+        while len(self._versions) > self.max_tags:
+            self._versions.popitem(last=False)
+
+
+class RedisCache:
+    """Shared backend so every worker sees the same entries and invalidations."""
+
+    def __init__(self, url, ttl=60, prefix='kyr:cache:'):
+        import redis  # Optional dependency, only needed when CACHE_REDIS_URL is set
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return json.loads(raw) if raw else None
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, json.dumps(value), ex=self.ttl)
+
+    def get_version(self, tag):
+        return int(self.client.get(self.prefix + 'v:' + tag) or 0)
+
+    def bump_version(self, tag):
+        self.client.incr(self.prefix + 'v:' + tag)
+
+
+def make_cache_backend(redis_url=None, max_entries=1024, ttl=60):
+    """Returns a RedisCache when a URL is given, otherwise an in-process LRUCache."""
+    if redis_url:
+        return RedisCache(redis_url, ttl=ttl)
+    return LRUCache(max_entries=max_entries, ttl=ttl)
+
+
+# --- Response cache ---
+class ResponseCache:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def cached(self, *tags, vary=None):
+        """Caches successful responses of a GET view.
+
+        Tags may reference the view's URL arguments, e.g. cached('comments:{post_id}').
+        `vary`, if given, is called per request and its result becomes part of the key, for
+        responses that depend on more than the URL (e.g. who is asking).
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                resolved = [tag.format(**kwargs) for tag in tags]
+                versions = ','.join(f'{tag}={self.backend.get_version(tag)}' for tag in resolved)
+                key = f'{request.full_path}|{vary() if vary else ""}|{versions}'
+
+                entry = self.backend.get(key)
+                if entry is None:
+                    response = current_app.make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    body = response.get_data(as_text=True)
+                    entry = {
+                        'body': body,
+                        'mimetype': response.mimetype,
+                        'etag': hashlib.sha1(body.encode()).hexdigest(),
+                        'last_modified': int(time.time())
+                    }
+                    self.backend.set(key, entry)
+                return self._conditional_response(entry)
+            return wrapper
+        return decorator
+
+    def invalidate(self, *tags):
+        for tag in tags:
+            self.backend.bump_version(tag)
+
+    @staticmethod
+    def _conditional_response(entry):
+        response = current_app.response_class(entry['body'], mimetype=entry['mimetype'])
+        response.set_etag(entry['etag'])
+        response.last_modified = datetime.fromtimestamp(entry['last_modified'], timezone.utc)
+        response.headers['Cache-Control'] = 'no-cache'
+        # Turns the response into a 304 when If-None-Match / If-Modified-Since match.
+        return response.make_conditional(request)
@@ -0,0 +1,379 @@
+# Offline retrieval engine behind /ask: ranks passages from the rights knowledge base
+# (knowledge/rights.json) and approved lawyers' forum answers for a free-text question.
+#
+# The index has two parts:
+#   - a base segment built by build() and written to `index_dir`: an inverted index (term ->
+#     postings of (passage, term frequency)) plus passage lengths and the passages themselves.
+#     load() memory-maps these files, so start-up is instant and the OS page cache is shared
+#     between workers;
+#   - a small in-memory delta segment for passages added with add() since the last build, plus
+#     a set of removed passages. Rebuilding (flask --app app build-rights-index) folds both
+#     into a new base segment.
+#
+# Ranking is BM25 over both segments. Query words that are not in the index are replaced by the
+# closest indexed word by character trigrams, so "arested" still finds "arrested". When NumPy is installed, every passage also gets a hashed
+# bag-of-words / character-trigram vector, stored as an .npy file and memory-mapped, and results
+# are re-ranked by a blend of BM25 and cosine similarity.
+#
+# Repeated questions are answered from an LRU cache, which is emptied whenever the index changes.
+
+import os
+import re
+import json
+import math
+import mmap
+import zlib
+import array
+import hashlib
+import threading
+from collections import Counter
+
+from response_cache import LRUCache
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+EMBEDDING_DIM = 256
+EMBEDDING_WEIGHT = 0.35 # Share of the final score that comes from cosine similarity
+MIN_SIMILARITY = 0.3 # Passages without matching words need at least this similarity
+MIN_SPELLING_SIMILARITY = 0.45 # Trigram Jaccard needed to swap an unknown word for an indexed one
+CANDIDATES = 50 # Passages taken from each ranking before blending
+
+STOPWORDS = set('''
+a an and are as at be been but by can could do does did for from had has have how i if in into
+is it its me my no not of on or our shall should so than that the their them then there these
+they this to was we were what when where which who whom why will with would you your
+'''.split())
+
+
+def stem(word):
+    """Very light suffix stripping so 'arrested', 'arrests' and 'arresting' share a term."""
+    for suffix, replacement in (('ies', 'y'), ('ing', ''), ('ed', ''), ('es', ''), ('s', '')):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)] + replacement
+    return word
+
+
+def tokenize(text):
+    return [stem(w) for w in re.findall(r'[a-z0-9]+', text.lower()) if w not in STOPWORDS]
+
+
+def trigrams(word):
+    padded = f'#{word}#'
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def embed(text):
+    """Hashed, L2-normalised vector of a text's words and character trigrams (needs NumPy)."""
+    vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    for word in re.findall(r'[a-z0-9]+', text.lower()):
+        if word in STOPWORDS:
+            continue
+        for feature in [word, *trigrams(word)]:
+            h = zlib.crc32(feature.encode())
+            vector[h % EMBEDDING_DIM] += 1.0 if h & 0x80000000 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def load_knowledge_base(path):
+    """Passages of the rights knowledge base as index documents, plus the file's fingerprint."""
+    with open(path, 'rb') as f:
+        raw = f.read()
+    documents = []
+    for entry in json.loads(raw):
+        documents.append({
+            'key': f"rights:{entry['id']}",
+            'source': 'rights',
+            'title': entry['title'],
+            'category': entry.get('category'),
+            'text': entry['text'],
+            'reference': entry.get('reference'),
+        })
+    return documents, hashlib.sha256(raw).hexdigest()
+
+
+def document_terms(document):
+    # The title counts too, so "Zero FIR" matches the passage titled that way.
+    return tokenize(f"{document['title']} {document['text']}")
+
+
+class BaseSegment:
+    """Read-only view of an index written by RightsIndex.build(), backed by mmap."""
+
+    def __init__(self, index_dir):
+        with open(os.path.join(index_dir, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.terms = self.meta.pop('terms')  # term -> [first posting, posting count]
+        self.doc_count = self.meta['doc_count']
+        self._files = []
+        self.postings = self._map(index_dir, 'postings.bin').cast('I')     # doc, tf, doc, tf, ...
+        self.lengths = self._map(index_dir, 'lengths.bin').cast('I')
+        self.offsets = self._map(index_dir, 'offsets.bin').cast('Q')       # doc -> byte offset
+        self.docs = self._map(index_dir, 'docs.jsonl')
+        self.embeddings = None
+        embeddings_path = os.path.join(index_dir, 'embeddings.npy')
+        if np is not None and os.path.exists(embeddings_path):
+            self.embeddings = np.load(embeddings_path, mmap_mode='r')
+
+    def _map(self, index_dir, name):
+        f = open(os.path.join(index_dir, name), 'rb')
+        self._files.append(f)
+        if os.fstat(f.fileno()).st_size == 0:
+            return memoryview(b'')
+        return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def term_postings(self, term):
+        entry = self.terms.get(term)
+        if not entry:
+            return ()
+        start, count = entry
+        pairs = self.postings[start * 2:(start + count) * 2]
+        return zip(pairs[0::2], pairs[1::2])
+
+    def document(self, doc_id):
+        start = self.offsets[doc_id]
+        end = self.offsets[doc_id + 1]
+        return json.loads(bytes(self.docs[start:end]))
+
+
+class RightsIndex:
+    def __init__(self, index_dir, use_embeddings=True, cache_size=512, cache_ttl=3600):
+        self.index_dir = index_dir
+        self.use_embeddings = use_embeddings and np is not None
+        self._cache = LRUCache(max_entries=cache_size, ttl=cache_ttl)
+        self._lock = threading.RLock()
+        self._base = None
+        self._reset_delta()
+
+    def _reset_delta(self):
+        self._delta_docs = []        # Documents added since the base segment was built
+        self._delta_postings = {}    # term -> [(doc id, tf)]
+        self._delta_lengths = []
+        self._delta_vectors = []
+        self._removed = set()        # Doc ids (base or delta) that no longer count
+        self._doc_ids = {}           # key -> doc id, for the keys add()/remove() may touch
+        self._trigram_terms = None   # trigram -> indexed terms, built on first use
+        self._generation = getattr(self, '_generation', 0) + 1
+
+    # --- Building and loading ---
+    def build(self, documents, fingerprint=None):
+        """Writes a new base segment from `documents` and switches to it."""
+        os.makedirs(self.index_dir, exist_ok=True)
+        postings, lengths, offsets, keys = {}, [], [0], {}
+        vectors = []
+        with open(self._tmp('docs.jsonl'), 'wb') as docs_file:
+            for doc_id, document in enumerate(documents):
+                terms = document_terms(document)
+                lengths.append(len(terms))
+                for term, tf in Counter(terms).items():
+                    postings.setdefault(term, []).append((doc_id, tf))
+                if self.use_embeddings:
+                    vectors.append(embed(f"{document['title']} {document['text']}"))
+                keys[document['key']] = doc_id
+                line = (json.dumps(document) + '\n').encode()
+                docs_file.write(line)
+                offsets.append(offsets[-1] + len(line))
+
+        flat, terms = array.array('I'), {}
+        for term, entries in postings.items():
+            terms[term] = [len(flat) // 2, len(entries)]
+            for doc_id, tf in entries:
+                flat.extend((doc_id, tf))
+        self._write_array('postings.bin', flat)
+        self._write_array('lengths.bin', array.array('I', lengths))
+        self._write_array('offsets.bin', array.array('Q', offsets))
+        if self.use_embeddings:
+            matrix = np.vstack(vectors) if vectors else np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+            with open(self._tmp('embeddings.npy'), 'wb') as f:
+                np.save(f, matrix)
+            os.replace(self._tmp('embeddings.npy'), os.path.join(self.index_dir, 'embeddings.npy'))
+        elif os.path.exists(os.path.join(self.index_dir, 'embeddings.npy')):
+            os.remove(os.path.join(self.index_dir, 'embeddings.npy')) # Left over from an earlier build
+        os.replace(self._tmp('docs.jsonl'), os.path.join(self.index_dir, 'docs.jsonl'))
+
+        meta = {
+            'doc_count': len(lengths),
+            'total_length': sum(lengths),
+            'fingerprint': fingerprint,
+            'keys': keys,
+            'terms': terms,
+        }
+        # meta.json is written last: a half-finished build never looks complete.
+        with open(self._tmp('meta.json'), 'w') as f:
+            json.dump(meta, f)
+        os.replace(self._tmp('meta.json'), os.path.join(self.index_dir, 'meta.json'))
+        return self.load()
+
+    def load(self):
+        """Maps the base segment from disk. Returns False if there is none yet."""
+        if not os.path.exists(os.path.join(self.index_dir, 'meta.json')):
+            return False
+        base = BaseSegment(self.index_dir)
+        with self._lock:
+            self._base = base
+            self._reset_delta()
+            self._doc_ids = dict(base.meta['keys'])
+            self._cache = LRUCache(max_entries=self._cache.max_entries, ttl=self._cache.ttl)
+        return True
+
+    @property
+    def fingerprint(self):
+        return self._base.meta.get('fingerprint') if self._base else None
+
+    def keys(self, prefix=''):
+        """Keys of every passage currently searchable."""
+        with self._lock:
+            return {key for key, doc_id in self._doc_ids.items()
+                    if key.startswith(prefix) and doc_id not in self._removed}
+
+    def _tmp(self, name):
+        # Per process, so workers building at the same time do not write into each other's files
+        return os.path.join(self.index_dir, f'{name}.{os.getpid()}.tmp')
+
+    def _write_array(self, name, values):
+        with open(self._tmp(name), 'wb') as f:
+            values.tofile(f)
+        os.replace(self._tmp(name), os.path.join(self.index_dir, name))
+
+    # --- Incremental updates ---
+    def add(self, document):
+        """Adds (or replaces) one passage without rebuilding the base segment."""
+        terms = document_terms(document)
+        vector = embed(f"{document['title']} {document['text']}") if self.use_embeddings else None
+        with self._lock:
+            self._remove_locked(document['key'])
+            doc_id = self._base_count() + len(self._delta_docs)
+            self._delta_docs.append(document)
+            self._delta_lengths.append(len(terms))
+            self._delta_vectors.append(vector)
+            for term, tf in Counter(terms).items():
+                if self._trigram_terms is not None and not self._is_indexed(term):
+                    self._add_to_vocabulary(term)
+                self._delta_postings.setdefault(term, []).append((doc_id, tf))
+            self._doc_ids[document['key']] = doc_id
+            self._generation += 1
+
+    def remove(self, key):
+        with self._lock:
+            if self._remove_locked(key):
+                self._generation += 1
+
+    def _remove_locked(self, key):
+        doc_id = self._doc_ids.pop(key, None)
+        if doc_id is None:
+            return False
+        self._removed.add(doc_id)
+        return True
+
+    def clear_cache(self):
+        with self._lock:
+            self._generation += 1
+
+    # --- Querying ---
+    def _base_count(self):
+        return self._base.doc_count if self._base else 0
+
+    def _document(self, doc_id):
+        base_count = self._base_count()
+        return self._base.document(doc_id) if doc_id < base_count else self._delta_docs[doc_id - base_count]
+
+    def search(self, query, limit=5):
+        """Best `limit` passages for `query`, each a document dict with an added 'score'."""
+        with self._lock:
+            cache_key = f'{self._generation}|{limit}|{" ".join(query.lower().split())}'
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                return cached
+            results = self._search_locked(query, limit)
+            self._cache.set(cache_key, results)
+            return results
+
+    def _is_indexed(self, term):
+        return term in self._delta_postings or (self._base is not None and term in self._base.terms)
+
+    def _add_to_vocabulary(self, term):
+        for trigram in trigrams(term):
+            self._trigram_terms.setdefault(trigram, set()).add(term)
+
+    def _correct_spelling(self, term):
+        """The indexed term most similar to `term` by trigram Jaccard similarity, or None."""
+        if len(term) < 4:
+            return None
+        if self._trigram_terms is None:
+            self._trigram_terms = {}
+            for known in list(self._base.terms if self._base else ()) + list(self._delta_postings):
+                self._add_to_vocabulary(known)
+        query_trigrams = trigrams(term)
+        shared = Counter()
+        for trigram in query_trigrams:
+            shared.update(self._trigram_terms.get(trigram, ()))
+        best, best_similarity = None, MIN_SPELLING_SIMILARITY
+        for candidate, common in shared.items():
+            similarity = common / (len(query_trigrams) + len(candidate) - common) # A word has len(word) trigrams
+            if similarity > best_similarity:
+                best, best_similarity = candidate, similarity
+        return best
+
+    def _query_terms(self, query):
+        terms = set()
+        for term in tokenize(query):
+            terms.add(term if self._is_indexed(term) else self._correct_spelling(term) or term)
+        return terms
+
+    def _search_locked(self, query, limit):
+        base_count = self._base_count()
+        doc_count = base_count + len(self._delta_docs)
+        if doc_count == 0:
+            return []
+        total_length = (self._base.meta['total_length'] if self._base else 0) + sum(self._delta_lengths)
+        average_length = total_length / doc_count or 1
+
+        # BM25. Removed passages still count towards document frequencies until the next build.
+        bm25 = Counter()
+        for term in self._query_terms(query):
+            base_postings = self._base.term_postings(term) if self._base else ()
+            delta_postings = self._delta_postings.get(term, [])
+            df = (self._base.terms.get(term, (0, 0))[1] if self._base else 0) + len(delta_postings)
+            if not df:
+                continue
+            idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+            for postings in (base_postings, delta_postings):
+                for doc_id, tf in postings:
+                    length = self._base.lengths[doc_id] if doc_id < base_count else self._delta_lengths[doc_id - base_count]
+                    bm25[doc_id] += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / average_length))
+        for doc_id in self._removed:
+            bm25.pop(doc_id, None)
+
+        scores = {doc_id: score for doc_id, score in bm25.most_common(CANDIDATES)}
+        if self.use_embeddings:
+            scores = self._blend_with_embeddings(query, scores, base_count)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [dict(self._document(doc_id), score=round(float(score), 4)) for doc_id, score in ranked]
+
+    def _blend_with_embeddings(self, query, bm25_scores, base_count):
+        query_vector = embed(query)
+        parts = []
+        if self._base is not None and self._base.embeddings is not None:
+            parts.append(np.asarray(self._base.embeddings) @ query_vector)
+        elif base_count:
+            return bm25_scores  # Base segment built without embeddings
+        if self._delta_vectors:
+            parts.append(np.vstack(self._delta_vectors) @ query_vector)
+        similarity = np.concatenate(parts) if parts else np.zeros(0, dtype=np.float32)
+        if self._removed:
+            similarity[list(self._removed)] = -1
+
+        candidates = set(bm25_scores)
+        top = min(CANDIDATES, len(similarity))
+        if top:
+            candidates.update(int(i) for i in np.argpartition(-similarity, top - 1)[:top] if similarity[i] >= MIN_SIMILARITY)
+        best_bm25 = max(bm25_scores.values(), default=0) or 1
+        return {
+            doc_id: (1 - EMBEDDING_WEIGHT) * bm25_scores.get(doc_id, 0) / best_bm25 + EMBEDDING_WEIGHT * float(similarity[doc_id])
+            for doc_id in candidates
+        }
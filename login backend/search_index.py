@@ -0,0 +1,115 @@
+# Full-text search over posts, comments and approved lawyers using SQLite FTS5.
+#
+# Each searchable table gets an external-content FTS5 table (the text is not stored twice, only
+# the index) plus INSERT/UPDATE/DELETE triggers, so the index follows every write made through
+# any code path. rebuild() repopulates the index from the source tables, e.g. after restoring a
+# backup or on a database created before search existed.
+#
+# FTS5 is SQLite-only; on other databases is_supported() is False and /search answers 501.
+
+import re
+
+from sqlalchemy import text
+
+# FTS table -> (source table, indexed columns)
+FTS_TABLES = {
+    'post_fts': ('post', ['content']),
+    'comment_fts': ('comment', ['content']),
+    'lawyer_fts': ('lawyer', ['full_name', 'city_of_practice', 'state_of_practice', 'bio']),
+}
+
+SNIPPET_TOKENS = 16
+
+
+def is_supported(engine):
+    return engine.dialect.name == 'sqlite'
+
+
+def setup(conn):
+    """Creates missing FTS tables and triggers on `conn`. Newly created tables are filled from existing rows."""
+    if not is_supported(conn):
+        return
+    existing = {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'"))}
+    for fts_table, (source, columns) in FTS_TABLES.items():
+        cols = ', '.join(columns)
+        new_cols = ', '.join(f'new.{c}' for c in columns)
+        old_cols = ', '.join(f'old.{c}' for c in columns)
+        # prefix='2 3' keeps the as-you-type prefix match on the last word cheap.
+        conn.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5("
+            f"{cols}, content='{source}', content_rowid='id', tokenize='porter unicode61', prefix='2 3')"
+        ))
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ai AFTER INSERT ON {source} BEGIN "
+            f"INSERT INTO {fts_table}(rowid, {cols}) VALUES (new.id, {new_cols}); END"
+        ))
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ad AFTER DELETE ON {source} BEGIN "
+            f"INSERT INTO {fts_table}({fts_table}, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); END"
+        ))
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {fts_table}_au AFTER UPDATE OF {cols} ON {source} BEGIN "
+            f"INSERT INTO {fts_table}({fts_table}, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); "
+            f"INSERT INTO {fts_table}(rowid, {cols}) VALUES (new.id, {new_cols}); END"
+        ))
+        if fts_table not in existing:
+            conn.execute(text(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')"))
+
+
+def rebuild(engine):
+    """Re-indexes every FTS table from its source table."""
+    with engine.begin() as conn:
+        for fts_table in FTS_TABLES:
+            conn.execute(text(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')"))
+            conn.execute(text(f"INSERT INTO {fts_table}({fts_table}) VALUES ('optimize')"))
+
+
+def to_match_query(user_query):
+    """Turns free text into a safe FTS5 query: every word must match, the last one as a prefix."""
+    words = re.findall(r'\w+', user_query)
+    if not words:
+        return None
+    terms = [f'"{w}"' for w in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+# The inner SELECT ranks and pages on the FTS table alone, which FTS5 can do without touching
+# the source rows; only the page of hits is then joined to the source table.
+SEARCH_SQL = {
+    'posts': """
+        SELECT p.id, p.timestamp, p.is_anonymous, p.user_id, u.name AS author, hits.snippet, hits.score
+        FROM (SELECT rowid, snippet(post_fts, 0, '<mark>', '</mark>', '…', :tokens) AS snippet, rank AS score
+              FROM post_fts WHERE post_fts MATCH :query ORDER BY rank LIMIT :limit OFFSET :offset) AS hits
+        JOIN post p ON p.id = hits.rowid
+        JOIN user u ON u.id = p.user_id
+        ORDER BY hits.score
+    """,
+    'comments': """
+        SELECT c.id, c.timestamp, c.post_id, c.parent_id, c.user_id, u.name AS author, hits.snippet, hits.score
+        FROM (SELECT rowid, snippet(comment_fts, 0, '<mark>', '</mark>', '…', :tokens) AS snippet, rank AS score
+              FROM comment_fts WHERE comment_fts MATCH :query ORDER BY rank LIMIT :limit OFFSET :offset) AS hits
+        JOIN comment c ON c.id = hits.rowid
+        JOIN user u ON u.id = c.user_id
+        ORDER BY hits.score
+    """,
+    # Only approved lawyers are searchable, so the status filter has to run before paging.
+    'lawyers': """
+        SELECT l.id, l.full_name, l.city_of_practice, l.state_of_practice,
+               snippet(lawyer_fts, -1, '<mark>', '</mark>', '…', :tokens) AS snippet, lawyer_fts.rank AS score
+        FROM lawyer_fts JOIN lawyer l ON l.id = lawyer_fts.rowid
+        WHERE lawyer_fts MATCH :query AND l.status = 'approved'
+        ORDER BY lawyer_fts.rank LIMIT :limit OFFSET :offset
+    """,
+}
+
+
+def search(session, kind, user_query, limit=20, offset=0):
+    """Returns ranked hits (best first) of `kind` ('posts', 'comments' or 'lawyers') as dicts."""
+    match = to_match_query(user_query)
+    if match is None:
+        return []
+    rows = session.execute(text(SEARCH_SQL[kind]), {
+        'query': match, 'limit': limit, 'offset': offset, 'tokens': SNIPPET_TOKENS
+    }).mappings().all()
+    return [dict(row) for row in rows]
@@ -0,0 +1,75 @@
+# Resized renditions of uploaded images (profile pictures, bar ID cards).
+#
+# The admin panel only needs small previews, but phones upload multi-megabyte photos. After an
+# upload is stored, ThumbnailGenerator.submit() renders a JPEG per entry in THUMBNAIL_SIZES on a
+# background thread, under <root>/variants/<size>/<original relative path>.jpg. /uploads serves
+# them for ?size=<name> once they exist and falls back to the original until then.
+#
+# Needs Pillow; without it submit() does nothing and the originals are always served.
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+# Variant name -> longest edge in pixels
+THUMBNAIL_SIZES = {'thumb': 160, 'medium': 640}
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp'}
+
+
+class ThumbnailGenerator:
+    def __init__(self, root, sizes=THUMBNAIL_SIZES, workers=1, quality=80):
+        self.root = root
+        self._real_root = os.path.abspath(root)
+        self.sizes = sizes
+        self.quality = quality
+        self.enabled = Image is not None
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='thumbnails')
+        self._in_flight = set()
+        self._lock = threading.Lock()
+
+    def variant_path(self, relative_path, size):
+        """Relative path of the `size` rendition of an upload."""
+        return '/'.join(['variants', size, os.path.splitext(relative_path)[0] + '.jpg'])
+
+    def submit(self, relative_path):
+        """Schedules every missing rendition of an uploaded image."""
+        if not self.enabled or os.path.splitext(relative_path)[1].lower() not in IMAGE_EXTENSIONS:
+            return
+        if not self._inside_root(relative_path) or relative_path.startswith('variants/'):
+            print(f"❌ Refusing to create thumbnails for {relative_path!r}: not an upload")
+            return
+        with self._lock:
+            if relative_path in self._in_flight:
+                return
+            self._in_flight.add(relative_path)
+        self._executor.submit(self._generate, relative_path)
+
+    def _inside_root(self, relative_path):
+        path = os.path.abspath(os.path.join(self._real_root, relative_path))
+        return path.startswith(self._real_root + os.sep)
+
+    def _generate(self, relative_path):
+        try:
+            with Image.open(os.path.join(self.root, relative_path)) as original:
+                image = ImageOps.exif_transpose(original).convert('RGB')
+            for size, max_edge in self.sizes.items():
+                destination = os.path.join(self.root, self.variant_path(relative_path, size))
+                if os.path.exists(destination):
+                    continue
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                variant = image.copy()
+                variant.thumbnail((max_edge, max_edge))
+                # Write to a temp name first so a half-written file is never served.
+                temp_path = destination + '.tmp'
+                variant.save(temp_path, 'JPEG', quality=self.quality, optimize=True)
+                os.replace(temp_path, destination)
+        except Exception as e:
+            print(f"❌ Failed to create thumbnails for {relative_path}: {e}")
+        finally:
+            with self._lock:
+                self._in_flight.discard(relative_path)
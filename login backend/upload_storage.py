@@ -0,0 +1,120 @@
+# Content-addressed storage for uploaded documents.
+#
+# Werkzeug's multipart parser normally spools every file part into a temporary file and we would
+# then copy it again with FileStorage.save(). UploadRequest swaps in a stream that writes each
+# chunk straight into the upload folder while hashing it and counting bytes, so:
+#   - memory stays flat no matter how large or how many the uploads are,
+#   - an oversized part is rejected (413) as soon as it crosses the limit, not after buffering,
+#   - the SHA-256 is ready when parsing finishes, with no second pass over the file.
+# UploadStorage.store() then moves the file to <root>/ab/cd/<sha256><ext>. Identical files end
+# up at the same path, so duplicates are stored once and names from different users never clash.
+
+import os
+import hashlib
+import tempfile
+import posixpath
+from dataclasses import dataclass
+
+from flask import Request
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.utils import secure_filename
+
+
+class UploadTooLarge(RequestEntityTooLarge):
+    description = 'An uploaded file exceeds the maximum allowed size.'
+
+
+@dataclass
+class StoredUpload:
+    path: str    # Relative to the upload root, e.g. 'ab/cd/abcd...ef.jpeg'
+    digest: str  # Hex SHA-256 of the content
+    size: int
+
+
+class HashingUploadStream:
+    """Writable temp file that hashes and size-checks everything written to it."""
+
+    def __init__(self, tmp_dir, max_size):
+        fd, self.temp_path = tempfile.mkstemp(dir=tmp_dir, suffix='.part')
+        self._file = os.fdopen(fd, 'w+b')
+        self._sha256 = hashlib.sha256()
+        self.max_size = max_size
+        self.size = 0
+        self.stored = False
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_size is not None and self.size > self.max_size:
+            raise UploadTooLarge()
+        self._sha256.update(data)
+        return self._file.write(data)
+
+    @property
+    def digest(self):
+        return self._sha256.hexdigest()
+
+    def discard(self):
+        self._file.close()
+        if not self.stored and os.path.exists(self.temp_path):
+            os.unlink(self.temp_path)
+
+    def __getattr__(self, name):
+        # read/seek/tell/close etc. go to the underlying file
+        return getattr(self._file, name)
+
+
+class UploadStorage:
+    def __init__(self, root, max_file_size=10 * 1024 * 1024, chunk_size=64 * 1024):
+        self.root = root
+        self.max_file_size = max_file_size
+        self.chunk_size = chunk_size
+        self.tmp_dir = os.path.join(root, '.incoming')
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def open_stream(self):
+        return HashingUploadStream(self.tmp_dir, self.max_file_size)
+
+    def store(self, file_storage):
+        """Moves an uploaded file into its content-addressed location and returns a StoredUpload."""
+        stream = file_storage.stream
+        if not isinstance(stream, HashingUploadStream):
+            # Not parsed through UploadRequest: hash it chunk by chunk on the way in instead.
+            stream = self.open_stream()
+            try:
+                for chunk in iter(lambda: file_storage.stream.read(self.chunk_size), b''):
+                    stream.write(chunk)
+            except Exception:
+                stream.discard()
+                raise
+
+        digest = stream.digest
+        extension = os.path.splitext(secure_filename(file_storage.filename or ''))[1].lower()
+        relative_path = posixpath.join(digest[:2], digest[2:4], digest + extension)
+        destination = os.path.join(self.root, *relative_path.split('/'))
+
+        stream.close()
+        if os.path.exists(destination):
+            os.unlink(stream.temp_path) # Same content is already stored
+        else:
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            os.replace(stream.temp_path, destination)
+        stream.stored = True
+        return StoredUpload(path=relative_path, digest=digest, size=stream.size)
+
+
+def make_request_class(storage):
+    """Request class whose file parts are streamed into `storage` while they are parsed."""
+
+    class UploadRequest(Request):
+        def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+            stream = storage.open_stream()
+            self.__dict__.setdefault('_upload_streams', []).append(stream)
+            return stream
+
+        def close(self):
+            super().close()
+            # Drop temp files of parts that were never stored (failed validation, errors...).
+            for stream in self.__dict__.get('_upload_streams', []):
+                stream.discard()
+
+    return UploadRequest
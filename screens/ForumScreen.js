@@ -5,6 +5,7 @@ import axios from 'axios';
 import { useFocusEffect } from '@react-navigation/native';
 
 const API_URL = 'http://192.168.1.47:5001';
+const PAGE_SIZE = 20; // Posts per request; more are loaded as the list is scrolled
 
 const timeAgo = (isoString) => {
     if (!isoString) return '';
@@ -89,6 +90,8 @@ const ForumScreen = ({ navigation, route }) => {
     const [posts, setPosts] = useState([]);
     const [loading, setLoading] = useState(true);
     const [sortBy, setSortBy] = useState('Hot');
+    const [nextCursor, setNextCursor] = useState(null); // null once the last page is loaded
+    const [loadingMore, setLoadingMore] = useState(false);
 
     useFocusEffect(
         React.useCallback(() => {
@@ -96,17 +99,26 @@ const ForumScreen = ({ navigation, route }) => {
         }, [sortBy])
     );
 
+    // Fetches one page of the feed; `before` is the next_cursor of the previous page.
+    const fetchPage = async (before) => {
+        const params = { limit: PAGE_SIZE };
+        if (before) params.before = before;
+        const response = await axios.get(`${API_URL}/posts`, { params });
+        // --- MODIFIED: Ensure comment_count is handled ---
+        const postsWithDetails = response.data.posts.map(p => ({ 
+            ...p, 
+            score: p.score || 0,
+            comment_count: p.comment_count || 0 // Make sure comment_count exists
+        }));
+        return { posts: postsWithDetails, nextCursor: response.data.next_cursor };
+    };
+
     const fetchPosts = async () => {
         setLoading(true);
         try {
-            const response = await axios.get(`${API_URL}/posts`);
-            // --- MODIFIED: Ensure comment_count is handled ---
-            const postsWithDetails = response.data.posts.map(p => ({ 
-                ...p, 
-                score: p.score || 0,
-                comment_count: p.comment_count || 0 // Make sure comment_count exists
-            }));
-            setPosts(postsWithDetails);
+            const page = await fetchPage(null);
+            setPosts(page.posts);
+            setNextCursor(page.nextCursor);
         } catch (error) {
             console.error("Failed to fetch posts:", error);
             Alert.alert("Error", "Could not fetch forum posts.");
@@ -115,6 +127,20 @@ const ForumScreen = ({ navigation, route }) => {
         }
     };
 
+    const loadMorePosts = async () => {
+        if (!nextCursor || loadingMore || loading) return;
+        setLoadingMore(true);
+        try {
+            const page = await fetchPage(nextCursor);
+            setPosts(currentPosts => [...currentPosts, ...page.posts]);
+            setNextCursor(page.nextCursor);
+        } catch (error) {
+            console.error("Failed to fetch more posts:", error);
+        } finally {
+            setLoadingMore(false);
+        }
+    };
+
     const handleVote = (postId, voteType) => {
         // This is UI only for now
     };
@@ -173,6 +199,9 @@ const ForumScreen = ({ navigation, route }) => {
                     contentContainerStyle={styles.listContainer}
                     onRefresh={fetchPosts}
                     refreshing={loading}
+                    onEndReached={loadMorePosts}
+                    onEndReachedThreshold={0.5}
+                    ListFooterComponent={loadingMore ? <ActivityIndicator color="#0A2240" style={{ marginVertical: 16 }} /> : null}
                 />
             )}
             <TouchableOpacity style={styles.fab} onPress={() => navigation.navigate('CreatePost', { userId: currentUserId })}>
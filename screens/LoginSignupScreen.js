@@ -23,6 +23,40 @@ const API_URL = 'http://192.168.1.47:5001'; // Example: 'http://192.168.1.5:5001
 const logo = require('../assets/logo.png');
 //const logo = { uri: 'http://googleusercontent.com/file_content/2' };
 
+// --- SESSION TOKENS ---
+// Every later axios request sends the access token. When the server says it has expired,
+// trade the refresh token for a new pair once and retry the request.
+// The refresh call goes through its own client, created before any token is set, so it carries
+// no stale Authorization header and never comes back through the interceptor below.
+const refreshClient = axios.create();
+let refreshToken = null;
+const startSession = (tokens) => {
+    axios.defaults.headers.common['Authorization'] = `Bearer ${tokens.access_token}`;
+    refreshToken = tokens.refresh_token;
+};
+const endSession = () => {
+    delete axios.defaults.headers.common['Authorization'];
+    refreshToken = null;
+};
+axios.interceptors.response.use(null, async (error) => {
+    const original = error.config;
+    const isRefresh = original?.url?.endsWith('/auth/refresh');
+    if (error.response?.data?.token_expired && refreshToken && !original._retried && !isRefresh) {
+        original._retried = true;
+        try {
+            const response = await refreshClient.post(`${API_URL}/auth/refresh`, { refresh_token: refreshToken });
+            startSession(response.data);
+        } catch (refreshError) {
+            // The refresh token is no good either: drop the session so the user can log in again.
+            endSession();
+            return Promise.reject(refreshError);
+        }
+        original.headers['Authorization'] = axios.defaults.headers.common['Authorization'];
+        return axios(original);
+    }
+    return Promise.reject(error);
+});
+
 const AuthScreen = ({ navigation }) => {
     // State to switch between 'Login', 'Signup', and 'ForgotPassword' forms
     const [authMode, setAuthMode] = useState('Login'); 
@@ -217,6 +251,7 @@ const AuthScreen = ({ navigation }) => {
         try {
             const response = await axios.post(`${API_URL}/login`, { email, password });
             Alert.alert('Success', response.data.message);
+            startSession(response.data);
             // On successful login, navigate to the main part of the app
             navigation.replace('MainApp', { user: response.data.user });
         } catch (error) {